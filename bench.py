@@ -0,0 +1,236 @@
+"""
+Benchmarks for the color, interpolation, state and export hot paths.
+
+    python bench.py -o results.json
+    python bench.py --compare results.json
+
+Runs without Krita. Results are JSON keyed by benchmark name with the
+best time per call in seconds. --compare exits with status 1 when any
+benchmark is slower than the baseline by more than --threshold.
+"""
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import timeit
+from functools import lru_cache, partial
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Callable, Dict, List, Optional
+from half_tone_selector.color import (
+    convertColorSpace,
+    interpolateOklch,
+)
+from half_tone_selector.state import (
+    AppState,
+    generateColors,
+    clearGenerateColorsCache,
+)
+from half_tone_selector.palette import (
+    exportPalette,
+    readPalette,
+)
+from half_tone_selector.gamut import oklchToSrgb
+
+script_path = Path(__file__).resolve().parent
+
+spaces = ['sRGB', 'LinearRGB', 'XYZ', 'Oklab', 'Oklch']
+
+def measure(func: Callable[[], None], repeat: int) -> dict:
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    times = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {'best': min(times), 'mean': sum(times) / len(times), 'number': number}
+
+def randomLch() -> List[float]:
+    return [random.uniform(0.1, 0.9), random.uniform(0, 0.2), random.uniform(0, 6.28)]
+
+def randomState(sets: int) -> AppState:
+    s = AppState(light=randomLch(), dark=randomLch(), k=0.5)
+    s.halfTones = [generateColors(AppState(light=randomLch(), dark=randomLch())) for _ in range(sets)]
+    return s
+
+Case = Callable[[], None]
+# Benchmark name -> setup returning the function to time. Setup only runs
+# for the benchmarks -k selects.
+Cases = Dict[str, Callable[[], Case]]
+
+def conversion(v, src: str, dst: str) -> Case:
+    return lambda: convertColorSpace(v, src, dst)
+
+def colorBenchmarks() -> Cases:
+    cases: Cases = {}
+    for src in spaces:
+        for dst in spaces:
+            if src != dst:
+                cases[f'convertColorSpace:{src}->{dst}'] = lambda src=src, dst=dst: \
+                    conversion(convertColorSpace(randomLch(), 'Oklch', src), src, dst)
+    cases['convertColorSpace:StringRGB->Oklch'] = \
+        lambda: conversion('#c08040', 'StringRGB', 'Oklch')
+    try:
+        import numpy as np
+    except ModuleNotFoundError:
+        return cases
+    n = 100000
+
+    @lru_cache(maxsize=None)
+    def array(src: str):
+        np.random.seed(0)
+        return convertColorSpace(np.random.rand(n, 3) * [0.8, 0.2, 6.28] + [0.1, 0, 0], 'Oklch', src)
+
+    for src in spaces:
+        for dst in spaces:
+            if src != dst:
+                cases[f'batch{n}:{src}->{dst}'] = lambda src=src, dst=dst: conversion(array(src), src, dst)
+    return cases
+
+def interpolationBenchmarks() -> Cases:
+    lch1 = [0.8, 0.12, 1.0]
+    lch2 = [0.3, 0.08, 4.0]
+    cases: Cases = {
+        'interpolateOklch': lambda: lambda: interpolateOklch(lch1, lch2, 0.3, 0.5),
+    }
+    for count in [5, 10, 100, 1000]:
+        s = AppState(light=lch1, dark=lch2, k=0.5, count=count)
+        cases[f'generateColors:{count}'] = lambda s=s: lambda: generateColors(s)
+        cases[f'generateColors:uncached:{count}'] = \
+            lambda s=s: lambda: (clearGenerateColorsCache(), generateColors(s))
+    return cases
+
+def gamutBenchmarks() -> Cases:
+    """Chroma reduction against per channel clipping, on mostly out of gamut tones."""
+    def scalar(mapping: str) -> Case:
+        lchs = [[random.uniform(0.05, 0.95), random.uniform(0.1, 0.35), random.uniform(0, 6.28)] for _ in range(100)]
+        return lambda: [oklchToSrgb(lch, mapping) for lch in lchs]
+
+    cases: Cases = {}
+    for mapping in ['clip', 'chroma']:
+        cases[f'oklchToSrgb:{mapping}:100'] = partial(scalar, mapping)
+    try:
+        import numpy as np
+        from half_tone_selector.batch import mapToGamutBatch
+    except ModuleNotFoundError:
+        return cases
+    n = 100000
+
+    @lru_cache(maxsize=None)
+    def array():
+        np.random.seed(0)
+        return np.random.rand(n, 3) * [0.9, 0.25, 6.28] + [0.05, 0.1, 0]
+
+    cases[f'batch{n}:oklchToSrgb:clip'] = lambda: conversion(array(), 'Oklch', 'sRGB')
+    cases[f'batch{n}:oklchToSrgb:chroma'] = \
+        lambda: lambda: convertColorSpace(mapToGamutBatch(array()), 'Oklch', 'sRGB')
+    return cases
+
+@lru_cache(maxsize=None)
+def seededState(sets: int) -> AppState:
+    """randomState(sets), the same whichever benchmark asks first."""
+    random.seed(sets)
+    return randomState(sets)
+
+def stateBenchmarks(temp: Path) -> Cases:
+    def saved(sets: int) -> Path:
+        path = temp / f'state{sets}.json'
+        if not path.exists():
+            seededState(sets).to_file(path)
+        return path
+
+    cases: Cases = {}
+    for sets in [100, 1000, 10000]:
+        cases[f'AppState.to_file:{sets}'] = \
+            lambda sets=sets: partial(seededState(sets).to_file, saved(sets))
+        cases[f'AppState.from_file:{sets}'] = \
+            lambda sets=sets: partial(AppState.from_file, saved(sets))
+    return cases
+
+def exportBenchmarks(temp: Path) -> Cases:
+    def exported(sets: int) -> Path:
+        path = temp / f'import{sets}.kpl'
+        exportPalette(seededState(sets).halfTones, path.stem, temp)
+        return path
+
+    cases: Cases = {}
+    for sets in [10, 1000]:
+        cases[f'exportPalette:{sets}'] = \
+            lambda sets=sets: partial(exportPalette, seededState(sets).halfTones, 'bench', temp)
+        cases[f'readPalette:{sets}'] = lambda sets=sets: partial(readPalette, exported(sets))
+    return cases
+
+def gitCommit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=script_path, capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def runBenchmarks(pattern: str, repeat: int) -> dict:
+    results = {}
+    with TemporaryDirectory() as temp:
+        groups = [
+            colorBenchmarks(),
+            interpolationBenchmarks(),
+            gamutBenchmarks(),
+            stateBenchmarks(Path(temp)),
+            exportBenchmarks(Path(temp)),
+        ]
+        for cases in groups:
+            for name, setup in cases.items():
+                if pattern not in name:
+                    continue
+                # Seeded by name, so a benchmark's data does not depend on
+                # which others -k selected.
+                random.seed(name)
+                results[name] = measure(setup(), repeat)
+                print(f'{name}: {results[name]["best"]*1e6:.2f}us', file=sys.stderr)
+    return {
+        'meta': {
+            'commit': gitCommit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        },
+        'results': results,
+    }
+
+def compare(current: dict, baseline: dict, threshold: float) -> bool:
+    """Print ratios against the baseline. False if anything regressed."""
+    ok = True
+    for name, r in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        ratio = r['best'] / base['best']
+        regressed = ratio > 1 + threshold
+        ok = ok and not regressed
+        flag = ' REGRESSION' if regressed else ''
+        print(f'{name}: {ratio:.2f}x{flag}', file=sys.stderr)
+    return ok
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-o', '--output', type=Path, default=None, help='Write JSON here instead of stdout.')
+    parser.add_argument('-k', '--filter', default='', help='Only run benchmarks whose name contains this.')
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('--compare', type=Path, default=None, help='Baseline JSON to compare against.')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Allowed slowdown, 0.1 is 10%%.')
+    args = parser.parse_args()
+
+    current = runBenchmarks(args.filter, args.repeat)
+    text = json.dumps(current, indent=2)
+    if args.output:
+        args.output.write_text(text)
+    else:
+        print(text)
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        if not compare(current, baseline, args.threshold):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
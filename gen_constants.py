@@ -0,0 +1,99 @@
+"""
+Generates half_tone_selector/colorConstants.py.
+
+    python gen_constants.py
+    python gen_constants.py --check
+
+The derived color matrices are computed with the generic matrix path
+(invertMat, multMat) and written out, so importing the plugin does not
+redo the elimination. --check exits with status 1 when the module is out
+of date or the 3x3 kernels disagree with the generic path.
+"""
+import argparse
+import sys
+from pathlib import Path
+from typing import Dict
+from half_tone_selector.matrix import (
+    Mat,
+    invertMat,
+    invertMat3,
+    multMat,
+    multMat3,
+    multMatVec,
+    multMatVec3,
+)
+from half_tone_selector.color import (
+    deriveRgbToXyzMat,
+    xyzToLmsMat,
+    lmsToOklabMat,
+)
+
+script_path = Path(__file__).resolve().parent
+output_path = script_path / 'half_tone_selector' / 'colorConstants.py'
+
+header = '''"""
+Derived color matrices.
+
+Generated by gen_constants.py from the generic matrix path, do not edit.
+"""
+from .matrix import Mat
+'''
+
+def deriveConstants() -> Dict[str, Mat]:
+    rgbToXyz = deriveRgbToXyzMat()
+    xyzToRgb = invertMat(rgbToXyz)
+    lmsToXyz = invertMat(xyzToLmsMat)
+    return {
+        'rgbToXyzMat': rgbToXyz,
+        'xyzToRgbMat': xyzToRgb,
+        'lmsToXyzMat': lmsToXyz,
+        'oklabToLmsMat': invertMat(lmsToOklabMat),
+        'lmsToRgbMat': multMat(xyzToRgb, lmsToXyz),
+    }
+
+def render(constants: Dict[str, Mat]) -> str:
+    lines = [header]
+    for name, mat in constants.items():
+        lines.append(f'{name}: Mat = [')
+        for row in mat:
+            lines.append(f'    [{", ".join(repr(x) for x in row)}],')
+        lines.append(']')
+    return '\n'.join(lines) + '\n'
+
+def kernelErrors(constants: Dict[str, Mat], tol: float = 1e-12) -> Dict[str, float]:
+    """Largest difference between each 3x3 kernel and the generic path."""
+    mats = [xyzToLmsMat, lmsToOklabMat, *constants.values()]
+    def diff(m1: Mat, m2: Mat) -> float:
+        return max(abs(x - y) for r1, r2 in zip(m1, m2) for x, y in zip(r1, r2))
+    errors = {
+        'invertMat3': max(diff(invertMat3(m), invertMat(m)) for m in mats),
+        'multMat3': max(diff(multMat3(m1, m2), multMat(m1, m2)) for m1 in mats for m2 in mats),
+        'multMatVec3': max(diff([multMatVec3(m, row)], [multMatVec(m, row)]) for m in mats for row in mats[0]),
+    }
+    return {name: e for name, e in errors.items() if e > tol}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Generate the derived color matrices.')
+    parser.add_argument('--check', action='store_true', help='Check instead of writing.')
+    args = parser.parse_args()
+
+    constants = deriveConstants()
+    text = render(constants)
+    if not args.check:
+        output_path.write_text(text)
+        print(f'Wrote {output_path}')
+        return
+
+    ok = True
+    if not output_path.exists() or output_path.read_text() != text:
+        print(f'{output_path.name} is out of date, run gen_constants.py.')
+        ok = False
+    for name, e in kernelErrors(constants).items():
+        print(f'{name} differs from the generic path by {e:.3g}.')
+        ok = False
+    if ok:
+        print('Constants and kernels match the generic path.')
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
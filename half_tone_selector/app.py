@@ -1,7 +1,9 @@
+from contextlib import contextmanager
 from typing import (
     Callable,
-    Dict,
+    Iterator,
     List,
+    Optional,
     Set,
 )
 from .matrix import (
@@ -15,6 +17,8 @@ from .ki import (
     getWindowColor,
     scaleColor,
 )
+from .callbacks import CallbackRegistry
+from .instrument import instrumented
 
 def getStyle() -> dict:
     windowColor = getWindowColor()
@@ -28,33 +32,75 @@ def getStyle() -> dict:
     return style
 
 class HalfToneSelectorApp:
-    """Class for interacting with AppState"""
-    def __init__(self, s: AppState) -> None:
+    """Class for interacting with AppState
+
+    schedule(func) should run func on the next event loop turn. When it is
+    given, setState only marks fields dirty and the callbacks of all dirty
+    fields run once in a single flush. Without it, setState dispatches
+    synchronously.
+
+    Callbacks run in priority then registration order, and their counts
+    and times are in callbacks.stats(). Adding and removing a set runs the
+    aboutTo* callbacks with its index before the list changes, then the
+    usual ones after.
+    """
+    def __init__(
+            self,
+            s: AppState,
+            schedule: Optional[Callable[[Callable[[], None]], None]] = None,
+            ) -> None:
         self.s = s
         # Style settings for widgets.
         self.style = getStyle()
-        self._cbs: Dict[str, Set[Callable[..., None]]] = {}
+        self.callbacks = CallbackRegistry()
+        self._schedule = schedule
+        self._dirty: Set[str] = set()
+        self._flushPending = False
+        self._transactionDepth = 0
 
     def setState(self, **kwargs) -> None:
-        callbacks = set()
         for k, v in kwargs.items():
             setattr(self.s, k, v)
-            if k in self._cbs:
-                callbacks |= self._cbs[k]
+            self._dirty.add(k)
+
+        if self._transactionDepth:
+            return
+        if self._schedule is None:
+            self.flush()
+        elif not self._flushPending:
+            self._flushPending = True
+            self._schedule(self.flush)
+
+    @instrumented('setState.dispatch')
+    def flush(self) -> None:
+        """Run the callbacks of every field changed since the last flush."""
+        self._flushPending = False
+        dirty = self._dirty
+        self._dirty = set()
+        self.callbacks.call(dirty)
 
-        for cb in callbacks:
-            cb()
+    @contextmanager
+    def transaction(self) -> Iterator['HalfToneSelectorApp']:
+        """Group setState calls. Callbacks run once when the outermost exits."""
+        self._transactionDepth += 1
+        try:
+            yield self
+        finally:
+            self._transactionDepth -= 1
+            if self._transactionDepth == 0 and self._dirty:
+                self.flush()
 
-    def registerCallback(self, fields: List[str], cb: Callable[..., None]) -> None:
-        for f in fields:
-            if f not in self._cbs:
-                self._cbs[f] = set()
-            self._cbs[f].add(cb)
+    def registerCallback(
+            self,
+            fields: List[str],
+            cb: Callable[..., None],
+            priority: int = 0,
+            ) -> None:
+        """Call cb when any of fields changes. Higher priority runs first."""
+        self.callbacks.register(fields, cb, priority)
 
     def unregisterCallback(self, fields: List[str], cb: Callable[..., None]) -> None:
-        for f in fields:
-            if f in self._cbs:
-                self._cbs[f].remove(cb)
+        self.callbacks.unregister(fields, cb)
 
     @property
     def visible(self) -> bool:
@@ -63,23 +109,46 @@ class HalfToneSelectorApp:
     @visible.setter
     def visible(self, value: bool) -> None:
         self.s.visibleMeta.visible = value
-        for cb in self._cbs.get('visible', []):
-            cb()
+        self.callbacks.call(['visible'])
 
     def halfLight(self) -> Vec:
         l, c, h = self.s.light
         return [l/2, c/2, h]
 
     def addHalfToneSet(self, hts: HalfToneSet) -> int:
+        return self.addHalfToneSets([hts])
+
+    def addHalfToneSets(self, sets: List[HalfToneSet]) -> int:
+        """Append sets with a single round of callbacks. The index of the
+        first is returned."""
         i = len(self.s.halfTones)
-        self.s.halfTones.append(hts)
-        for cb in self._cbs.get('addHalfToneSet', []):
-            cb(i)
+        if not sets:
+            return i
+        self.callbacks.call(['aboutToAddHalfToneSet'], i, len(sets))
+        self.s.halfTones.extend(sets)
+        self.callbacks.call(['addHalfToneSet'], i, len(sets))
         return i
 
+    def _indexOf(self, hts: HalfToneSet) -> int:
+        # By identity, since equal sets can be saved more than once.
+        for i, other in enumerate(self.s.halfTones):
+            if other is hts:
+                return i
+        return -1
+
     def removeHalfToneSet(self, hts: HalfToneSet) -> int:
-        i = self.s.halfTones.index(hts)
+        i = self._indexOf(hts)
+        if i < 0:
+            raise ValueError('Half tone set is not saved.')
+        self.callbacks.call(['aboutToRemoveHalfToneSet'], i)
         self.s.halfTones.pop(i)
-        for cb in self._cbs.get('removeHalfToneSet', []):
-            cb(i)
+        self.callbacks.call(['removeHalfToneSet'], i)
+        return i
+
+    def renameHalfToneSet(self, hts: HalfToneSet, name: str) -> int:
+        """Rename hts. Callbacks only run if it is a saved set."""
+        hts.name = name
+        i = self._indexOf(hts)
+        if i >= 0:
+            self.callbacks.call(['renameHalfToneSet'], i)
         return i
@@ -8,20 +8,72 @@ from typing import (
     Tuple,
     Dict,
     Callable,
+    Sequence,
+    Union,
     Any,
 )
 
 Unary = Callable[[Any], Any]
-AutoCompInput = List[Tuple[Unary, str, str]]
+Stages = Tuple[Unary, ...]
+AutoCompInput = List[Tuple[Union[Unary, Sequence[Unary]], str, str]]
 AutoCompOutput = Callable[[Any, str, str], Any]
 
+class Linear:
+    """Edge that multiplies by a matrix.
+
+    apply(mat, x) applies the matrix and fuse(m2, m1) returns the matrix
+    that applies m1 then m2. Adjacent linear edges are fused at build time.
+    """
+    def __init__(
+            self,
+            mat: Any,
+            apply: Callable[[Any, Any], Any],
+            fuse: Callable[[Any, Any], Any],
+            ) -> None:
+        self.mat = mat
+        self.apply = apply
+        self.fuse = fuse
+
+    def __call__(self, x: Any) -> Any:
+        return self.apply(self.mat, x)
+
+    def then(self, other: 'Linear') -> 'Linear':
+        return Linear(self.fuse(other.mat, self.mat), self.apply, self.fuse)
+
 def compose(*funcs: Unary) -> Unary:
     return reduce(lambda f, g: lambda x: g(f(x)), funcs)
 
+def fuseStages(stages: Stages) -> Stages:
+    """Collapse runs of Linear stages into a single Linear stage."""
+    fused: List[Unary] = []
+    for f in stages:
+        if fused and isinstance(f, Linear) and isinstance(fused[-1], Linear):
+            fused[-1] = fused[-1].then(f)
+        else:
+            fused.append(f)
+    return tuple(fused)
+
+def flatten(stages: Stages) -> Unary:
+    """Single function that runs the stages in order."""
+    if len(stages) == 0:
+        return lambda x: x
+    if len(stages) == 1:
+        return stages[0]
+    def _flat(x: Any) -> Any:
+        for f in stages:
+            x = f(x)
+        return x
+    return _flat
+
 def createComps(funcs: AutoCompInput) -> AutoCompOutput:
+    """Compositions between every reachable pair of vertices.
+
+    An edge function may be a sequence of stages, which lets linear parts
+    of an edge be fused with linear parts of its neighbours.
+    """
     vertIdMap: Dict[str, int] = dict()
     vertList: List[str] = list()
-    compMap: Dict[Tuple[str, str], Unary] = dict()
+    pathMap: Dict[Tuple[str, str], Stages] = dict()
     for _, src, dst in funcs:
         if src not in vertIdMap:
             vertIdMap[src] = len(vertIdMap)
@@ -37,10 +89,10 @@ def createComps(funcs: AutoCompInput) -> AutoCompOutput:
         i = vertIdMap[src]
         j = vertIdMap[dst]
         table[i][j] = 1
-        compMap[(src, dst)] = f
+        pathMap[(src, dst)] = tuple(f) if isinstance(f, (list, tuple)) else (f,)
     for i, src in enumerate(vertList):
         table[i][i] = 0
-        compMap[(src, src)] = lambda x: x
+        pathMap[(src, src)] = ()
 
     for k in range(n):
         for i, j in product(range(n), range(n)):
@@ -50,9 +102,9 @@ def createComps(funcs: AutoCompInput) -> AutoCompOutput:
                 src = vertList[i]
                 dst = vertList[j]
                 vert = vertList[k]
-                f = compMap[(src, vert)]
-                g = compMap[(vert, dst)]
-                compMap[(src, dst)] = compose(f, g)
+                pathMap[(src, dst)] = pathMap[(src, vert)] + pathMap[(vert, dst)]
+
+    compMap = {key: flatten(fuseStages(stages)) for key, stages in pathMap.items()}
 
     def _comp(v: Any, src: str, dst: str) -> Any:
         if (src, dst) in compMap:
@@ -0,0 +1,338 @@
+"""
+Array versions of the color conversions in color.py.
+
+Colors are NumPy arrays with shape (..., 3), typically (N, 3). The edge
+functions mirror the scalar ones and are routed through the same
+createComps graph, so any conversion available to convertColorSpace is
+available here as a handful of array operations.
+"""
+from functools import lru_cache
+import math
+from math import pi
+from typing import Any, Optional, Sequence
+import numpy as np
+from .autocomp import Linear, createComps
+from .color import (
+    Vec,
+    interp,
+    oklchCurve,
+    toLinearRgb as _toLinearRgbRef,
+    xyzToLmsMat,
+    lmsToOklabMat,
+)
+from .colorConstants import (
+    rgbToXyzMat,
+    xyzToRgbMat,
+    lmsToXyzMat,
+    oklabToLmsMat,
+    lmsToRgbMat,
+)
+from .gamut import (
+    GamutIndex,
+    defaultIndex,
+    bracketWidth,
+    channelTol,
+    chromaTol,
+)
+
+Arr = np.ndarray
+
+# Transposed, since colors are rows.
+_rgbToXyzArr = np.array(rgbToXyzMat).T
+_xyzToRgbArr = np.array(xyzToRgbMat).T
+_xyzToLmsArr = np.array(xyzToLmsMat).T
+_lmsToOklabArr = np.array(lmsToOklabMat).T
+_lmsToXyzArr = np.array(lmsToXyzMat).T
+_oklabToLmsArr = np.array(oklabToLmsMat).T
+
+def fromHexRgb(rgbs: Sequence[str]) -> Arr:
+    """#RRGGBB strings to sRGB"""
+    data = bytes.fromhex(''.join(rgb[1:7] for rgb in rgbs))
+    return np.frombuffer(data, dtype=np.uint8).reshape(-1, 3) / 255
+
+def fromLinearRgb(linearRgb: Arr) -> Arr:
+    """Linear RGB to sRGB"""
+    x = np.clip(linearRgb, 0, 1)
+    return np.where(
+        x >= 0.0031308,
+        1.055 * np.power(x, 1.0/2.4) - 0.055,
+        12.92 * x)
+
+def toLinearRgb(rgb: Arr) -> Arr:
+    """sRGB to Linear RGB"""
+    if isQuantized(rgb):
+        return toLinearRgbQuantized(rgb)
+    x = np.asarray(rgb, dtype=np.float64)
+    return np.where(
+        x >= 0.04045,
+        np.power((np.maximum(x, 0.04045) + 0.055)/(1 + 0.055), 2.4),
+        x / 12.92)
+
+# Intervals in the interpolated transfer tables.
+_lutSize = 4096
+
+@lru_cache(maxsize=None)
+def _quantizedTable(maxValue: int) -> Arr:
+    """Exact sRGB to linear values for every integer code."""
+    codes = [i / maxValue for i in range(maxValue + 1)]
+    return np.array(_toLinearRgbRef(codes))
+
+@lru_cache(maxsize=None)
+def _lut(func: Any) -> tuple:
+    grid = np.linspace(0, 1, _lutSize + 1)
+    table = func(grid)
+    slopes = np.append(np.diff(table), 0)
+    return table, slopes
+
+def _interpLut(func: Any, x: Arr) -> Arr:
+    table, slopes = _lut(func)
+    x = np.clip(x, 0, 1)
+    x *= _lutSize
+    i = x.astype(np.intp)
+    x -= i
+    y = np.take(slopes, i)
+    y *= x
+    y += np.take(table, i)
+    return y
+
+def isQuantized(rgb: Any) -> bool:
+    return getattr(rgb, 'dtype', None) in (np.uint8, np.uint16)
+
+def toLinearRgbQuantized(rgb: Arr) -> Arr:
+    """8-bit or 16-bit sRGB codes to Linear RGB by exact table lookup"""
+    return _quantizedTable(np.iinfo(rgb.dtype).max)[rgb]
+
+def toLinearRgbLut(rgb: Arr) -> Arr:
+    """sRGB to Linear RGB using an interpolated table.
+
+    Float inputs are clamped to [0, 1]. The max error against toLinearRgb
+    is below 1e-7. Quantized inputs are exact.
+    """
+    if isQuantized(rgb):
+        return toLinearRgbQuantized(rgb)
+    return _interpLut(toLinearRgb, rgb)
+
+def fromLinearRgbLut(linearRgb: Arr) -> Arr:
+    """Linear RGB to sRGB using an interpolated table.
+
+    The max error against fromLinearRgb is below 2e-5, about 0.005 of an
+    8-bit step. The error peaks just above the linear segment near 0.
+    """
+    return _interpLut(fromLinearRgb, linearRgb)
+
+def convertLinearRgbToXyz(linearRgb: Arr) -> Arr:
+    return linearRgb @ _rgbToXyzArr
+
+def convertXyzToLinearRgb(xyz: Arr) -> Arr:
+    return xyz @ _xyzToRgbArr
+
+def _applyMat(matT: Arr, x: Arr) -> Arr:
+    return x @ matT
+
+def _fuseMat(m2T: Arr, m1T: Arr) -> Arr:
+    return m1T @ m2T
+
+def linear(matT: Arr) -> Linear:
+    return Linear(matT, _applyMat, _fuseMat)
+
+def toOklab(xyz: Arr) -> Arr:
+    """XYZ to Oklab"""
+    lms1 = xyz @ _xyzToLmsArr
+    lms2 = np.cbrt(lms1)
+    return lms2 @ _lmsToOklabArr
+
+def _cube(lms: Arr) -> Arr:
+    return lms**3
+
+def fromOklab(lab: Arr) -> Arr:
+    """Oklab to XYZ"""
+    lms2 = lab @ _oklabToLmsArr
+    lms1 = _cube(lms2)
+    return lms1 @ _lmsToXyzArr
+
+def toOklch(lab: Arr) -> Arr:
+    """Oklab to Oklch"""
+    l, a, b = np.moveaxis(lab, -1, 0)
+    return np.stack([l, np.hypot(a, b), np.arctan2(b, a)], axis=-1)
+
+def fromOklch(lch: Arr) -> Arr:
+    """Oklch to Oklab"""
+    l, c, h = np.moveaxis(lch, -1, 0)
+    return np.stack([l, c * np.cos(h), c * np.sin(h)], axis=-1)
+
+def _createComps(fromLinear: Any, toLinear: Any) -> Any:
+    return createComps([
+        (fromHexRgb, 'StringRGB', 'sRGB'),
+        (fromLinear, 'LinearRGB', 'sRGB'),
+        (toLinear, 'sRGB', 'LinearRGB'),
+        (linear(_rgbToXyzArr), 'LinearRGB', 'XYZ'),
+        (linear(_xyzToRgbArr), 'XYZ', 'LinearRGB'),
+        ((linear(_xyzToLmsArr), np.cbrt, linear(_lmsToOklabArr)), 'XYZ', 'Oklab'),
+        ((linear(_oklabToLmsArr), _cube, linear(_lmsToXyzArr)), 'Oklab', 'XYZ'),
+        (toOklch, 'Oklab', 'Oklch'),
+        (fromOklch, 'Oklch', 'Oklab'),
+    ])
+
+_comps = {
+    'exact': _createComps(fromLinearRgb, toLinearRgb),
+    'lut': _createComps(fromLinearRgbLut, toLinearRgbLut),
+}
+
+def convertColorSpaceBatch(
+        colors: Any,
+        src: str,
+        dst: str,
+        transfer: str = 'exact',
+        ) -> Arr:
+    """Convert an (..., 3) array of colors from src to dst.
+
+    'StringRGB' takes a sequence of #RRGGBB strings instead. uint8 and
+    uint16 'sRGB' arrays are integer codes and are linearized by exact
+    table lookup. transfer='lut' uses the interpolated transfer tables
+    for float inputs.
+    """
+    if src != 'StringRGB' and not (src == 'sRGB' and isQuantized(colors)):
+        colors = np.asarray(colors, dtype=np.float64)
+    return _comps[transfer](colors, src, dst)
+
+# NumPy's arctan2 and hypot can differ from math's in the last bit.
+_atan2Ufunc = np.frompyfunc(math.atan2, 2, 1)
+_hypotUfunc = np.frompyfunc(math.hypot, 2, 1)
+
+def _atan2Exact(y: Arr, x: Arr) -> Arr:
+    return _atan2Ufunc(y, x).astype(np.float64)
+
+def _hypotExact(x: Arr, y: Arr) -> Arr:
+    return _hypotUfunc(x, y).astype(np.float64)
+
+def interpolateOklchBatch(
+        lch1: Vec,
+        lch2: Vec,
+        t: Any,
+        k: Any,
+        exact: bool = True,
+        ) -> Arr:
+    """interpolateOklch over arrays of t and k.
+
+    t and k are broadcast against each other and the result has shape
+    broadcast(t, k) + (3,). The endpoint setup is done once, and the
+    arithmetic matches the scalar path step for step. With exact=True the
+    results are identical to interpolateOklch. exact=False uses NumPy's
+    arctan2 and hypot, which is faster but may differ by a few ulps.
+    """
+    atan2 = _atan2Exact if exact else np.arctan2
+    hypot = _hypotExact if exact else np.hypot
+    t, k = np.broadcast_arrays(
+        np.asarray(t, dtype=np.float64),
+        np.asarray(k, dtype=np.float64))
+    l1, c1, h1 = lch1
+    l2, c2, h2 = lch2
+    l = interp(l1, l2, t)
+    c = interp(c1, c2, t)
+
+    if c1 == 0 or c2 == 0:
+        h = np.full(t.shape, h1 if c2 == 0 else h2, dtype=np.float64)
+        return np.stack([l, c, h], axis=-1)
+
+    hMid, p, cosp, rotationDirection = oklchCurve(lch1, lch2)
+    d1 = interp(-p, p, t)
+    d2 = interp(2*pi - p, p, t)
+    cosd1 = np.cos(d1)
+    sind1 = np.sin(d1)
+
+    if cosp != 1:
+        a = interp(2*cosp - cosd1, cosd1, (k + 1 - 2*cosp)/(2 - 2*cosp))
+        b = sind1
+        cUpper = c * hypot(a, b)
+        hUpper = hMid + atan2(b, a) * rotationDirection
+    else:
+        cUpper = c
+        hUpper = np.full(t.shape, h1, dtype=np.float64)
+
+    if cosp != 0:
+        s = -(k + 1 - 2*cosp)/(2*cosp)
+        a = interp(2*cosp - cosd1, np.cos(d2), s)
+        b = interp(sind1, np.sin(d2), s)
+        cLower = c * hypot(a, b)
+        hLower = hMid + atan2(b, a) * rotationDirection
+    else:
+        cLower = interp(c1, -c2, t)
+        hLower = np.where(cLower < 0, h2, h1)
+        cLower = np.abs(cLower)
+
+    upper = k >= 2*cosp - 1
+    c = np.where(upper, cUpper, cLower)
+    h = np.where(upper, hUpper, hLower)
+    return np.stack([l, c, h % (2*pi)], axis=-1)
+
+def maxChromaBatch(index: GamutIndex, l: Arr, h: Arr) -> Arr:
+    """GamutIndex.maxChroma over arrays of lightness and hue."""
+    nL, nH = index.lightnessCount, index.hueCount
+    table = np.frombuffer(index.table, dtype=np.float64).reshape(nL, nH)
+    x = np.clip(l, 0, 1) * (nL - 1)
+    i = np.minimum(x.astype(np.intp), nL - 2)
+    fx = x - i
+    y = np.mod(h, 2*pi) / (2*pi) * nH
+    j = y.astype(np.intp)
+    fy = y - j
+    j %= nH
+    j1 = (j + 1) % nH
+    c0 = table[i, j] + (table[i, j1] - table[i, j]) * fy
+    c1 = table[i+1, j] + (table[i+1, j1] - table[i+1, j]) * fy
+    return c0 + (c1 - c0) * fx
+
+_lmsToRgbArr = np.array(lmsToRgbMat).T
+
+def _insideBatchFunc(l: Arr, h: Arr) -> Any:
+    """Array version of gamut._insideFunc, for a subset of the colors."""
+    a = l[:, None] * _oklabToLmsArr[0]
+    b = np.cos(h)[:, None] * _oklabToLmsArr[1] + np.sin(h)[:, None] * _oklabToLmsArr[2]
+    def _inside(c: Arr, rows: Any = slice(None)) -> Arr:
+        lms = a[rows] + b[rows] * c[:, None]
+        rgb = (lms * lms * lms) @ _lmsToRgbArr
+        return np.all((rgb >= -channelTol) & (rgb <= 1 + channelTol), axis=-1)
+    return _inside
+
+def oklchToSrgbBatch(lch: Any, gamutMapping: str = 'clip') -> Arr:
+    """gamut.oklchToSrgb over an (..., 3) array of Oklch colors."""
+    if gamutMapping == 'chroma':
+        lch = mapToGamutBatch(lch)
+    return convertColorSpaceBatch(lch, 'Oklch', 'sRGB')
+
+def mapToGamutBatch(lch: Any, index: Optional[GamutIndex] = None) -> Arr:
+    """mapToGamut over an (..., 3) array of Oklch colors."""
+    lch = np.array(lch, dtype=np.float64)
+    flat = lch.reshape(-1, 3)
+    l, c, h = flat[:, 0], flat[:, 1], flat[:, 2]
+    # Black and white, which only have zero chroma.
+    atLimit = (l <= 0) | (l >= 1)
+    flat[atLimit, 0] = np.clip(l[atLimit], 0, 1)
+    flat[atLimit, 1] = 0
+    out = np.flatnonzero(~atLimit)
+    inside = _insideBatchFunc(l[out], h[out])
+    outside = ~inside(c[out])
+    out = out[outside]
+    l, c, h = l[out], c[out], h[out]
+    inside = _insideBatchFunc(l, h)
+    lo, hi = np.zeros(len(out)), c.copy()
+    index = index or defaultIndex()
+    if index:
+        estimate = maxChromaBatch(index, l, h)
+        lo = np.clip(estimate - bracketWidth, 0, c)
+        hi = np.clip(estimate + bracketWidth, 0, c)
+        loOutside = ~inside(lo)
+        hiInside = inside(hi)
+        lo, hi = (
+            np.where(loOutside, 0, np.where(hiInside, hi, lo)),
+            np.where(loOutside, lo, np.where(hiInside, c, hi)),
+        )
+    # Only keep bisecting the colors whose bracket is still wide.
+    active = np.flatnonzero(hi - lo > chromaTol)
+    while len(active):
+        mid = (lo[active] + hi[active]) / 2
+        midInside = inside(mid, active)
+        lo[active[midInside]] = mid[midInside]
+        hi[active[~midInside]] = mid[~midInside]
+        active = active[hi[active] - lo[active] > chromaTol]
+    flat[out, 1] = lo
+    return lch
@@ -0,0 +1,114 @@
+"""
+Callback registry for HalfToneSelectorApp.
+
+Callbacks run in a fixed order: higher priority first, then in the order
+they were registered. Each call is timed, and the counts and cumulative
+times are kept per callback name so slow handlers can be found at
+runtime, e.g. from the Scripter:
+
+    for stat in app.callbacks.stats()[:10]:
+        print(stat)
+"""
+import itertools
+import time
+from dataclasses import dataclass
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Tuple,
+)
+
+Callback = Callable[..., None]
+
+def callbackName(cb: Callback) -> str:
+    """module.qualname:line, which tells lambdas apart."""
+    func = getattr(cb, '__func__', cb)
+    name = f'{getattr(func, "__module__", "")}.{getattr(func, "__qualname__", repr(func))}'
+    code = getattr(func, '__code__', None)
+    return f'{name}:{code.co_firstlineno}' if code else name
+
+@dataclass
+class CallbackStats:
+    name: str
+    count: int = 0
+    totalTime: float = 0.0
+    maxTime: float = 0.0
+
+    @property
+    def meanTime(self) -> float:
+        return self.totalTime / self.count if self.count else 0.0
+
+class CallbackRegistry:
+    def __init__(self, timed: bool = True) -> None:
+        # Whether calls are timed into stats.
+        self.timed = timed
+        # field -> callback -> ((-priority, seq), name)
+        self._entries: Dict[str, Dict[Callback, Tuple[Tuple[int, int], str]]] = {}
+        self._ordered: Dict[str, List[Tuple[Callback, str]]] = {}
+        self._seq = itertools.count()
+        self._stats: Dict[str, CallbackStats] = {}
+
+    def register(self, fields: Iterable[str], cb: Callback, priority: int = 0) -> None:
+        """Add cb to fields. Registering again keeps the original position."""
+        name = callbackName(cb)
+        for f in fields:
+            entries = self._entries.setdefault(f, {})
+            if cb not in entries:
+                entries[cb] = ((-priority, next(self._seq)), name)
+                self._ordered.pop(f, None)
+
+    def unregister(self, fields: Iterable[str], cb: Callback) -> None:
+        for f in fields:
+            if f in self._entries:
+                del self._entries[f][cb]
+                self._ordered.pop(f, None)
+
+    def _orderedFor(self, field: str) -> List[Tuple[Callback, str]]:
+        ordered = self._ordered.get(field)
+        if ordered is None:
+            entries = self._entries.get(field, {})
+            ordered = [(cb, entries[cb][1]) for cb in sorted(entries, key=lambda cb: entries[cb][0])]
+            self._ordered[field] = ordered
+        return ordered
+
+    def callbacks(self, fields: Iterable[str]) -> List[Tuple[Callback, str]]:
+        """Callbacks of any of fields in call order, each once."""
+        fields = list(fields)
+        if len(fields) == 1:
+            return self._orderedFor(fields[0])
+        merged: Dict[Callback, Tuple[Tuple[int, int], str]] = {}
+        for f in fields:
+            for cb, entry in self._entries.get(f, {}).items():
+                if cb not in merged or entry[0] < merged[cb][0]:
+                    merged[cb] = entry
+        return [(cb, merged[cb][1]) for cb in sorted(merged, key=lambda cb: merged[cb][0])]
+
+    def call(self, fields: Iterable[str], *args: Any) -> None:
+        for cb, name in self.callbacks(fields):
+            if not self.timed:
+                cb(*args)
+                continue
+            start = time.perf_counter()
+            try:
+                cb(*args)
+            finally:
+                self._record(name, time.perf_counter() - start)
+
+    def _record(self, name: str, elapsed: float) -> None:
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = CallbackStats(name)
+        stats.count += 1
+        stats.totalTime += elapsed
+        if elapsed > stats.maxTime:
+            stats.maxTime = elapsed
+
+    def stats(self) -> List[CallbackStats]:
+        """Per callback stats, slowest in total first."""
+        return sorted(self._stats.values(), key=lambda s: s.totalTime, reverse=True)
+
+    def resetStats(self) -> None:
+        self._stats.clear()
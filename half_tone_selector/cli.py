@@ -0,0 +1,142 @@
+"""
+Headless batch generation of half tone sets.
+
+    python -m half_tone_selector.cli params.jsonl -o sets.jsonl
+    python -m half_tone_selector.cli params.csv --format kpl --name Batch -o palettes/
+    python -m half_tone_selector.cli palettes/ -o sets.jsonl
+
+Each input row holds AppState fields (light, dark, k, count, cos) and an
+optional name. light and dark are Oklch lists or #RRGGBB strings. A .kpl
+file or a directory of them is read back into sets instead. Nothing here
+imports krita or PyQt.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import (
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+)
+from .state import (
+    AppState,
+    HalfToneSet,
+    generateColors,
+)
+from .gamut import gamutMappings
+
+paramFields = ['light', 'dark', 'k', 'count', 'cos']
+
+def _parseCsvValue(name: str, value: str):
+    if name in ('light', 'dark'):
+        return value if value.startswith('#') else json.loads(value)
+    elif name == 'k':
+        return float(value)
+    elif name == 'count':
+        return int(value)
+    elif name == 'cos':
+        return value.strip().lower() in ('1', 'true', 'yes')
+    return value
+
+def readParams(path: Path) -> Iterator[dict]:
+    """Rows of tone parameters from a JSONL or CSV file."""
+    with path.open(newline='') as f:
+        if path.suffix.lower() == '.csv':
+            for row in csv.DictReader(f):
+                yield {
+                    k: _parseCsvValue(k, v)
+                    for k, v in row.items()
+                    if k in paramFields + ['name'] and v not in (None, '')
+                }
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def generateSet(params: dict) -> HalfToneSet:
+    s = AppState.from_dict({k: v for k, v in params.items() if k in paramFields})
+    hts = generateColors(s)
+    hts.name = params.get('name', '')
+    return hts
+
+def generateSets(rows: Iterable[dict], workers: int) -> Iterator[HalfToneSet]:
+    """Generate sets in input order, across a process pool if workers > 1."""
+    if workers <= 1:
+        yield from map(generateSet, rows)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(generateSet, rows, chunksize=256)
+
+def writeJson(sets: Iterable[HalfToneSet], output: Optional[Path]) -> int:
+    n = 0
+    f = output.open('w') if output else sys.stdout
+    try:
+        for hts in sets:
+            f.write(json.dumps(hts.to_dict()))
+            f.write('\n')
+            n += 1
+    finally:
+        if output:
+            f.close()
+    return n
+
+def writeKpl(
+        sets: Iterable[HalfToneSet],
+        rows: int,
+        name: str,
+        output: Optional[Path],
+        gamutMapping: str = 'clip',
+        ) -> int:
+    from .palette import exportPalette
+    n = 0
+    def _counted():
+        nonlocal n
+        for hts in sets:
+            n += 1
+            yield hts
+    exportPalette(_counted(), name, output or Path.cwd(), rows=rows, gamutMapping=gamutMapping)
+    return n
+
+def parseArgs(argv: Optional[List[str]]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog='half_tone_selector',
+        description='Generate half tone sets from a JSONL or CSV parameter file.')
+    parser.add_argument('params', type=Path,
+        help='JSONL or CSV of tone parameters, or .kpl palettes to import.')
+    parser.add_argument('-o', '--output', type=Path, default=None,
+        help='Output file for json (default stdout), directory for kpl (default cwd).')
+    parser.add_argument('-f', '--format', choices=['json', 'kpl'], default='json')
+    parser.add_argument('-n', '--name', default='half_tones', help='Palette name for kpl.')
+    parser.add_argument('-g', '--gamut-mapping', choices=gamutMappings, default='clip',
+        help='How kpl colors outside sRGB are brought into gamut.')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1)
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parseArgs(argv)
+    start = time.perf_counter()
+    if args.params.is_dir() or args.params.suffix.lower() == '.kpl':
+        from .palette import importPalettes
+        imported = list(importPalettes([args.params], args.workers, processes=True))
+        sets: Iterable[HalfToneSet] = imported
+        rows = len(imported)
+    else:
+        sets = generateSets(readParams(args.params), args.workers)
+        # The palette header needs the row count before any entries.
+        rows = sum(1 for _ in readParams(args.params)) if args.format == 'kpl' else 0
+    if args.format == 'json':
+        n = writeJson(sets, args.output)
+    else:
+        n = writeKpl(sets, rows, args.name, args.output, args.gamut_mapping)
+    elapsed = time.perf_counter() - start
+    rate = n / elapsed if elapsed > 0 else float('inf')
+    print(f'{n} sets in {elapsed:.3f}s ({rate:.0f} sets/s)', file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
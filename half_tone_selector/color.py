@@ -1,15 +1,20 @@
 from math import atan2, sqrt, cos, sin, pi, hypot, dist
+from functools import partial
+from typing import Any, Callable, Tuple
 from .matrix import (
     Vec,
     Mat,
     clamp,
     invertMat,
     transposeMat,
-    multMat,
+    multMat3,
     multMatVec,
+    multMatVec3,
     scaleVec,
 )
-from .autocomp import createComps
+from . import colorConstants
+from .autocomp import Linear, createComps
+from .instrument import instrumented
 
 def fromHexRgb(rgb: str) -> Vec:
     # #RRGGBB
@@ -56,41 +61,48 @@ def deriveRgbToXyzMat() -> Mat:
     coeff = multMatVec(invertMat(primaries), whitepoint)
     return [[xi*c for xi, c in zip(row, coeff)] for row in primaries]
 
-_rgbToXyzMat = deriveRgbToXyzMat()
-_xyzToRgbMat = invertMat(_rgbToXyzMat)
+# Derived matrices are precomputed by gen_constants.py.
+_rgbToXyzMat = colorConstants.rgbToXyzMat
+_xyzToRgbMat = colorConstants.xyzToRgbMat
 
 def convertLinearRgbToXyz(linearRgb: Vec) -> Vec:
-    return multMatVec(_rgbToXyzMat, linearRgb)
+    return multMatVec3(_rgbToXyzMat, linearRgb)
 
 def convertXyzToLinearRgb(xyz: Vec) -> Vec:
-    return multMatVec(_xyzToRgbMat, xyz)
+    return multMatVec3(_xyzToRgbMat, xyz)
 
 # https://colour.readthedocs.io/en/latest/_modules/colour/models/oklab.html
-_xyzToLmsMat = [
+xyzToLmsMat = [
     [0.8189330101, 0.3618667424,-0.1288597137],
     [0.0329845436, 0.9293118715, 0.0361456387],
     [0.0482003018, 0.2643662691, 0.6338517070],
 ]
-_lmsToOklabMat = [
+lmsToOklabMat = [
     [0.2104542553, 0.7936177850,-0.0040720468],
     [1.9779984951,-2.4285922050, 0.4505937099],
     [0.0259040371, 0.7827717662,-0.8086757660],
 ]
-_lmsToXyzMat = invertMat(_xyzToLmsMat)
-_oklabToLmsMat = invertMat(_lmsToOklabMat)
+_lmsToXyzMat = colorConstants.lmsToXyzMat
+_oklabToLmsMat = colorConstants.oklabToLmsMat
+
+def _cbrt(lms: Vec) -> Vec:
+    return [x**(1/3) for x in lms]
+
+def _cube(lms: Vec) -> Vec:
+    return [x**3 for x in lms]
 
 def toOklab(xyz: Vec) -> Vec:
     """XYZ to Oklab"""
-    lms1 = multMatVec(_xyzToLmsMat, xyz)
-    lms2 = [x**(1/3) for x in lms1]
-    lab = multMatVec(_lmsToOklabMat, lms2)
+    lms1 = multMatVec3(xyzToLmsMat, xyz)
+    lms2 = _cbrt(lms1)
+    lab = multMatVec3(lmsToOklabMat, lms2)
     return lab
 
 def fromOklab(lab: Vec) -> Vec:
     """Oklab to XYZ"""
-    lms2 = multMatVec(_oklabToLmsMat, lab)
-    lms1 = [x**3 for x in lms2]
-    xyz = multMatVec(_lmsToXyzMat, lms1)
+    lms2 = multMatVec3(_oklabToLmsMat, lab)
+    lms1 = _cube(lms2)
+    xyz = multMatVec3(_lmsToXyzMat, lms1)
     return xyz
 
 def toOklch(lab: Vec) -> Vec:
@@ -107,18 +119,37 @@ def fromOklch(lch: Vec) -> Vec:
     b = c * sin(h)
     return [l, a, b]
 
-convertColorSpace = createComps([
+def linear(mat: Mat) -> Linear:
+    return Linear(mat, multMatVec3, multMat3)
+
+# Matrix stages are split out so createComps can fuse neighbouring ones,
+# e.g. _lmsToXyzMat and _xyzToRgbMat on the way from Oklab to LinearRGB.
+_convertColorSpace = createComps([
     (fromHexRgb, 'StringRGB', 'sRGB'),
     (fromLinearRgb, 'LinearRGB', 'sRGB'),
     (toLinearRgb, 'sRGB', 'LinearRGB'),
-    (convertLinearRgbToXyz, 'LinearRGB', 'XYZ'),
-    (convertXyzToLinearRgb, 'XYZ', 'LinearRGB'),
-    (toOklab, 'XYZ', 'Oklab'),
-    (fromOklab, 'Oklab', 'XYZ'),
+    (linear(_rgbToXyzMat), 'LinearRGB', 'XYZ'),
+    (linear(_xyzToRgbMat), 'XYZ', 'LinearRGB'),
+    ((linear(xyzToLmsMat), _cbrt, linear(lmsToOklabMat)), 'XYZ', 'Oklab'),
+    ((linear(_oklabToLmsMat), _cube, linear(_lmsToXyzMat)), 'Oklab', 'XYZ'),
     (toOklch, 'Oklab', 'Oklch'),
     (fromOklch, 'Oklch', 'Oklab'),
 ])
 
+def _conversionPath(v: Any, src: str, dst: str) -> str:
+    return f'{src}->{dst}' + (' batch' if hasattr(v, 'ndim') else '')
+
+@instrumented('convertColorSpace', _conversionPath)
+def convertColorSpace(v: Any, src: str, dst: str) -> Any:
+    """Convert a color from src to dst.
+
+    NumPy arrays of shape (..., 3) are converted by the batch engine.
+    """
+    if hasattr(v, 'ndim'):
+        from .batch import convertColorSpaceBatch
+        return convertColorSpaceBatch(v, src, dst)
+    return _convertColorSpace(v, src, dst)
+
 def getColorError(lab: Vec) -> float:
     linear = convertColorSpace(lab, 'Oklab', 'LinearRGB')
     clampedLinear = [clamp(x, 0, 1) for x in linear]
@@ -128,8 +159,72 @@ def getColorError(lab: Vec) -> float:
 def interp(a: float, b: float, t: float) -> float:
     return a*(1-t) + b*t
 
+def oklchCurve(lch1: Vec, lch2: Vec) -> Tuple[float, float, float, int]:
+    """Terms of interpolateOklch that only depend on the endpoints."""
+    _, _, h1 = lch1
+    _, _, h2 = lch2
+    angle = abs(h2 - h1)
+    smallAngle = min(angle, 2*pi - angle)
+    rotationDirection = -1 if (angle <= pi) ^ (h1 <= h2) else 1
+    h = (h1 + h2)/2 + (angle > pi)*pi
+    p = smallAngle / 2
+    cosp = cos(p)
+    return h, p, cosp, rotationDirection
+
+def _interpolateFlat(l1: float, l2: float, c1: float, c2: float, h: float, t: float, k: float) -> Vec:
+    return [interp(l1, l2, t), interp(c1, c2, t), h]
+
+def _interpolate(
+        l1: float, l2: float, c1: float, c2: float, h1: float, h2: float,
+        hMid: float, p: float, cosp: float, rotationDirection: int,
+        t: float, k: float,
+        ) -> Vec:
+    # t: [0, 1], k: [-1, 1]
+    l = interp(l1, l2, t)
+    c = interp(c1, c2, t)
+    h = hMid
+    d1 = interp(-p, p, t)
+    d2 = interp(2*pi - p, p, t)
+    if k >= 2*cosp - 1:
+        if cosp != 1:
+            a = interp(2*cosp - cos(d1), cos(d1), (k + 1 - 2*cosp)/(2 - 2*cosp))
+            b = sin(d1)
+            c *= hypot(a, b)
+            h += atan2(b, a) * rotationDirection
+        else:
+            h = h1
+    else:
+        if cosp != 0:
+            a = interp(2*cosp - cos(d1), cos(d2), -(k + 1 - 2*cosp)/(2*cosp))
+            b = interp(sin(d1), sin(d2), -(k + 1 - 2*cosp)/(2*cosp))
+            c *= hypot(a, b)
+            h += atan2(b, a) * rotationDirection
+        else:
+            c = interp(c1, -c2, t)
+            if c < 0:
+                c = -c
+                h = h2
+            else:
+                h = h1
+
+    return [l, c, h % (2*pi)]
+
+# Counted on the curves too, since generateColors calls them directly.
+_countedFlat = instrumented('interpolateOklch')(_interpolateFlat)
+_counted = instrumented('interpolateOklch')(_interpolate)
+
+def interpolateOklchFunc(lch1: Vec, lch2: Vec) -> Callable[[float, float], Vec]:
+    """interpolateOklch with the endpoint setup done once."""
+    l1, c1, h1 = lch1
+    l2, c2, h2 = lch2
+    if c1 == 0 or c2 == 0:
+        return partial(_countedFlat, l1, l2, c1, c2, h1 if c2 == 0 else h2)
+    return partial(_counted, l1, l2, c1, c2, h1, h2, *oklchCurve(lch1, lch2))
+
 def interpolateOklch(lch1: Vec, lch2: Vec, t: float, k: float) -> Vec:
     # t: [0, 1], k: [-1, 1]
+    # Inline rather than through interpolateOklchFunc, which would build
+    # the curve for a single point.
     l1, c1, h1 = lch1
     l2, c2, h2 = lch2
     l = interp(l1, l2, t)
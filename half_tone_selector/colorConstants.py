@@ -0,0 +1,32 @@
+"""
+Derived color matrices.
+
+Generated by gen_constants.py from the generic matrix path, do not edit.
+"""
+from .matrix import Mat
+
+rgbToXyzMat: Mat = [
+    [0.41239079926595923, 0.35758433938387796, 0.18048078840183432],
+    [0.21263900587151022, 0.7151686787677559, 0.07219231536073373],
+    [0.019330818715591856, 0.11919477979462609, 0.9505321522496608],
+]
+xyzToRgbMat: Mat = [
+    [3.240969941904524, -1.5373831775700944, -0.4986107602930036],
+    [-0.9692436362808798, 1.8759675015077206, 0.041555057407175626],
+    [0.05563007969699364, -0.20397695888897668, 1.0569715142428784],
+]
+lmsToXyzMat: Mat = [
+    [1.2270138511035211, -0.5577999806518221, 0.2812561489664678],
+    [-0.040580178423280586, 1.11225686961683, -0.07167667866560119],
+    [-0.0763812845057069, -0.4214819784180127, 1.5861632204407947],
+]
+oklabToLmsMat: Mat = [
+    [0.9999999984505197, 0.39633779217376786, 0.21580375806075883],
+    [1.0000000088817607, -0.10556134232365633, -0.0638541747717059],
+    [1.0000000546724108, -0.08948418209496577, -1.2914855378640917],
+]
+lmsToRgbMat: Mat = [
+    [4.077186823717317, -3.3076225216643644, 0.23085919548795208],
+    [-1.2685764914005104, 2.609687114485009, -0.34115574866072784],
+    [-0.004196542231656303, -0.7033996761010275, 1.7067960338654133],
+]
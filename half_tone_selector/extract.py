@@ -0,0 +1,193 @@
+"""
+Light and dark tones from an image.
+
+Pixels are streamed in tiles of (N, 3) uint8 sRGB, either from an image
+file or from a Krita layer, and reduced to a fixed size uniform sample
+as they go, so memory stays bounded for any image size. The sample is
+converted to Oklab in one batch and split into a light and a dark group,
+by k-means or by a lightness histogram, whose centers are proposed as
+AppState.light and AppState.dark.
+"""
+from math import pi
+from pathlib import Path
+from typing import (
+    Any,
+    Iterable,
+    Iterator,
+    Tuple,
+)
+import numpy as np
+from .matrix import Vec
+from .batch import (
+    Arr,
+    convertColorSpaceBatch,
+)
+
+extractMethods = ['kmeans', 'histogram']
+
+def _opaqueRgb(pixels: Arr, rgb: Tuple[int, int, int], alpha: int) -> Arr:
+    """(N, 3) sRGB of an (h, w, 4) array, without mostly transparent pixels."""
+    opaque = pixels[..., alpha] >= 128
+    return pixels[opaque][:, list(rgb)]
+
+def _qimageRgba(image: Any) -> Arr:
+    from PyQt5.QtGui import QImage # type: ignore
+    image = image.convertToFormat(QImage.Format_RGBA8888)
+    h, w = image.height(), image.width()
+    ptr = image.constBits()
+    ptr.setsize(image.bytesPerLine() * h)
+    rows = np.frombuffer(ptr, np.uint8).reshape(h, image.bytesPerLine())
+    # Copied, since the array would otherwise outlive the image's buffer.
+    return rows[:, :4*w].reshape(h, w, 4).copy()
+
+def imageTiles(path: Path, maxPixels: int = 1 << 22) -> Iterator[Arr]:
+    """Opaque pixels of an image file as (N, 3) uint8 sRGB.
+
+    Images over maxPixels are decoded downscaled when the format supports
+    it, e.g. JPEG, else in strips of rows when it supports clipping.
+    Other formats are decoded whole.
+    """
+    from PyQt5.QtCore import QRect, QSize # type: ignore
+    from PyQt5.QtGui import QImageIOHandler, QImageReader # type: ignore
+    reader = QImageReader(str(path))
+    reader.setAutoTransform(True)
+    size = reader.size()
+    w, h = size.width(), size.height()
+    if w * h > maxPixels and reader.supportsOption(QImageIOHandler.ScaledSize):
+        scale = (maxPixels / (w * h)) ** 0.5
+        reader.setScaledSize(QSize(max(1, int(w * scale)), max(1, int(h * scale))))
+    elif w * h > maxPixels and reader.supportsOption(QImageIOHandler.ClipRect):
+        rows = max(1, maxPixels // w)
+        for y in range(0, h, rows):
+            strip = QImageReader(str(path))
+            strip.setClipRect(QRect(0, y, w, min(rows, h - y)))
+            image = strip.read()
+            if image.isNull():
+                raise ValueError(f'Cannot read {path}: {strip.errorString()}')
+            yield _opaqueRgb(_qimageRgba(image), (0, 1, 2), 3)
+        return
+    image = reader.read()
+    if image.isNull():
+        raise ValueError(f'Cannot read {path}: {reader.errorString()}')
+    yield _opaqueRgb(_qimageRgba(image), (0, 1, 2), 3)
+
+def layerTiles(node: Any, tileSize: int = 1024) -> Iterator[Arr]:
+    """Opaque pixels of a Krita layer as (N, 3) uint8 sRGB.
+
+    Only 8 bit RGBA layers are read, which Krita stores as BGRA. The
+    layer's profile is assumed to be sRGB.
+    """
+    if node.colorModel() != 'RGBA' or node.colorDepth() != 'U8':
+        raise ValueError('Only 8 bit RGBA layers are supported.')
+    bounds = node.bounds()
+    for y in range(bounds.top(), bounds.bottom() + 1, tileSize):
+        for x in range(bounds.left(), bounds.right() + 1, tileSize):
+            w = min(tileSize, bounds.right() + 1 - x)
+            h = min(tileSize, bounds.bottom() + 1 - y)
+            data = bytes(node.pixelData(x, y, w, h))
+            pixels = np.frombuffer(data, np.uint8).reshape(h, w, 4)
+            yield _opaqueRgb(pixels, (2, 1, 0), 3)
+
+def reservoirSample(tiles: Iterable[Arr], size: int = 1 << 16, seed: int = 0) -> Arr:
+    """Uniform sample of at most size rows across all tiles.
+
+    Every row gets a random key and the rows with the smallest keys so
+    far are kept, so only size + one tile of rows is held at a time. Once
+    the sample is full, rows keyed above its largest key are dropped
+    before anything is copied.
+    """
+    rng = np.random.default_rng(seed)
+    sample = np.empty((0, 3), np.uint8)
+    keys = np.empty(0)
+    for tile in tiles:
+        tileKeys = rng.random(len(tile))
+        if len(keys) == size:
+            candidates = tileKeys < keys.max()
+            tile, tileKeys = tile[candidates], tileKeys[candidates]
+        if not len(tile):
+            continue
+        sample = np.concatenate([sample, tile])
+        keys = np.concatenate([keys, tileKeys])
+        if len(keys) > size:
+            keep = np.argpartition(keys, size)[:size]
+            sample, keys = sample[keep], keys[keep]
+    return sample
+
+def _nearestCenter(points: Arr, centers: Arr) -> Arr:
+    d = ((points[:, None, :] - centers[None, :, :]) ** 2).sum(axis=-1)
+    return d.argmin(axis=1)
+
+def kmeans(points: Arr, k: int, iterations: int = 20) -> Tuple[Arr, Arr]:
+    """Centers and sizes of k clusters of (N, 3) points.
+
+    Starts from lightness quantiles, so results are deterministic.
+    """
+    k = min(k, len(points))
+    order = np.argsort(points[:, 0])
+    centers = points[order[(2*np.arange(k) + 1) * len(points) // (2*k)]].copy()
+    for _ in range(iterations):
+        labels = _nearestCenter(points, centers)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, points)
+        moved = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centers)
+        if np.allclose(moved, centers, atol=1e-6):
+            return centers, counts
+        centers = moved
+    # Not converged, so the last counts are for the previous centers.
+    return centers, np.bincount(_nearestCenter(points, centers), minlength=k)
+
+def otsuThreshold(values: Arr, bins: int = 256) -> float:
+    """Threshold on [0, 1] values maximizing the between class variance."""
+    hist, edges = np.histogram(np.clip(values, 0, 1), bins=bins, range=(0, 1))
+    centers = (edges[:-1] + edges[1:]) / 2
+    w0 = np.cumsum(hist)
+    w1 = w0[-1] - w0
+    m0 = np.cumsum(hist * centers)
+    mean0 = m0 / np.maximum(w0, 1)
+    mean1 = (m0[-1] - m0) / np.maximum(w1, 1)
+    between = w0 * w1 * (mean0 - mean1) ** 2
+    return float(edges[1:][np.argmax(between)])
+
+def _toOklch(lab: Arr) -> Vec:
+    l, c, h = convertColorSpaceBatch(lab, 'Oklab', 'Oklch').tolist()
+    return [l, c, h % (2*pi)]
+
+def proposeTones(
+        sample: Arr,
+        method: str = 'kmeans',
+        k: int = 4,
+        minShare: float = 0.05,
+        ) -> Tuple[Vec, Vec]:
+    """light and dark Oklch for an (N, 3) uint8 sRGB sample.
+
+    kmeans takes the lightest and darkest clusters holding at least
+    minShare of the sample. histogram splits lightness at the Otsu
+    threshold and takes the mean of each side.
+    """
+    if not len(sample):
+        raise ValueError('No opaque pixels to extract tones from.')
+    lab = convertColorSpaceBatch(sample, 'sRGB', 'Oklab')
+    if method == 'kmeans':
+        centers, counts = kmeans(lab, k)
+        large = centers[counts >= minShare * len(lab)]
+        if not len(large):
+            large = centers[counts > 0]
+        large = large[np.argsort(large[:, 0])]
+        return _toOklch(large[-1]), _toOklch(large[0])
+    elif method == 'histogram':
+        t = otsuThreshold(lab[:, 0])
+        light, dark = lab[lab[:, 0] > t], lab[lab[:, 0] <= t]
+        if not len(light) or not len(dark):
+            light = dark = lab
+        return _toOklch(light.mean(axis=0)), _toOklch(dark.mean(axis=0))
+    raise ValueError(f'Unknown extract method: {method}')
+
+def extractTones(
+        tiles: Iterable[Arr],
+        method: str = 'kmeans',
+        sampleSize: int = 1 << 16,
+        seed: int = 0,
+        ) -> Tuple[Vec, Vec]:
+    """light and dark Oklch proposed for the pixels of tiles."""
+    return proposeTones(reservoirSample(tiles, sampleSize, seed), method)
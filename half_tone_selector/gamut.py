@@ -0,0 +1,207 @@
+"""
+Precomputed sRGB gamut boundary in Oklch.
+
+The max in-gamut chroma is tabulated over a grid of lightness and hue and
+cached on disk next to the plugin. Gamut queries are then a bilinear
+table lookup instead of two full conversion chains.
+
+mapToGamut brings a color into gamut by reducing chroma at constant
+lightness and hue, instead of clipping each RGB channel, which shifts both.
+The table gives a tight bracket on the boundary that a short bisection
+then refines.
+"""
+import struct
+import sys
+from array import array
+from functools import lru_cache
+from math import pi, cos, sin
+from pathlib import Path
+from typing import Callable, Optional
+from .matrix import (
+    Vec,
+    clamp,
+    multMatVec3,
+)
+from .color import convertColorSpace
+from .colorConstants import (
+    lmsToRgbMat,
+    oklabToLmsMat,
+)
+
+cachePath = Path(__file__).resolve().parent.parent / 'half_tone_selector_gamut.bin'
+
+_magic = b'HTSG'
+_version = 1
+# magic, version, lightness samples, hue samples. The table follows as
+# little endian doubles.
+_header = struct.Struct('<4sIII')
+_swapBytes = sys.byteorder == 'big'
+
+class GamutIndex:
+    """Max sRGB chroma indexed by (L, h).
+
+    Rows are lightness samples over [0, 1] inclusive and columns are hue
+    samples over [0, 2pi). Lookups are bilinear, so the boundary is rounded
+    off slightly at the hue cusps.
+    """
+    def __init__(self, table: array, lightnessCount: int, hueCount: int) -> None:
+        if len(table) != lightnessCount * hueCount:
+            raise ValueError('Table size does not match the grid.')
+        self.table = table
+        self.lightnessCount = lightnessCount
+        self.hueCount = hueCount
+
+    def maxChroma(self, l: float, h: float) -> float:
+        nL = self.lightnessCount
+        nH = self.hueCount
+        x = clamp(l, 0, 1) * (nL - 1)
+        i = min(int(x), nL - 2)
+        fx = x - i
+        y = (h % (2*pi)) / (2*pi) * nH
+        j = int(y)
+        fy = y - j
+        j %= nH
+        j1 = (j + 1) % nH
+
+        t = self.table
+        row0 = i * nH
+        row1 = row0 + nH
+        c0 = t[row0 + j] + (t[row0 + j1] - t[row0 + j]) * fy
+        c1 = t[row1 + j] + (t[row1 + j1] - t[row1 + j]) * fy
+        return c0 + (c1 - c0) * fx
+
+    def gamutDistance(self, lch: Vec) -> float:
+        """Chroma beyond the boundary, 0 when in gamut."""
+        l, c, h = lch
+        return max(c - self.maxChroma(l, h), 0.0)
+
+    def isInGamut(self, lch: Vec, tol: float = 1e-3) -> bool:
+        return self.gamutDistance(lch) <= tol
+
+    def to_file(self, path: Path) -> None:
+        with path.open('wb') as f:
+            f.write(_header.pack(_magic, _version, self.lightnessCount, self.hueCount))
+            table = self.table
+            if _swapBytes:
+                table = array('d', table)
+                table.byteswap()
+            table.tofile(f)
+
+    @staticmethod
+    def from_file(path: Path) -> 'GamutIndex':
+        with path.open('rb') as f:
+            magic, version, nL, nH = _header.unpack(f.read(_header.size))
+            if magic != _magic or version != _version:
+                raise ValueError(f'Not a gamut index: {str(path)}')
+            table = array('d')
+            table.fromfile(f, nL * nH)
+            if _swapBytes:
+                table.byteswap()
+        return GamutIndex(table, nL, nH)
+
+def buildGamutIndex(
+        lightnessCount: int = 257,
+        hueCount: int = 360,
+        iterations: int = 40,
+        ) -> GamutIndex:
+    """Bisect the max chroma of every grid cell at once. Requires NumPy."""
+    import numpy as np
+    from .batch import convertColorSpaceBatch
+
+    ls = np.linspace(0, 1, lightnessCount)[:, None]
+    hs = np.arange(hueCount)[None, :] * (2*pi / hueCount)
+    ls, hs = np.broadcast_arrays(ls, hs)
+    lo = np.zeros(ls.shape)
+    hi = np.full(ls.shape, 0.5)
+    for _ in range(iterations):
+        mid = (lo + hi) / 2
+        linear = convertColorSpaceBatch(np.stack([ls, mid, hs], axis=-1), 'Oklch', 'LinearRGB')
+        inside = np.all((linear >= -1e-9) & (linear <= 1 + 1e-9), axis=-1)
+        lo = np.where(inside, mid, lo)
+        hi = np.where(inside, hi, mid)
+    return GamutIndex(array('d', lo.ravel().tolist()), lightnessCount, hueCount)
+
+@lru_cache(maxsize=None)
+def getGamutIndex(path: Path = cachePath) -> GamutIndex:
+    """Load the cached index, building and saving it on first use."""
+    try:
+        return GamutIndex.from_file(path)
+    except (OSError, ValueError, EOFError, struct.error):
+        pass
+    index = buildGamutIndex()
+    try:
+        index.to_file(path)
+    except OSError:
+        pass
+    return index
+
+@lru_cache(maxsize=None)
+def defaultIndex() -> Optional[GamutIndex]:
+    """The shared index, or None with no cached table and no NumPy."""
+    try:
+        return getGamutIndex()
+    except ModuleNotFoundError:
+        # No cached table and no NumPy to build one.
+        return None
+
+# How colors outside sRGB are brought in: per channel clipping or chroma
+# reduction at constant L and h.
+gamutMappings = ['clip', 'chroma']
+
+# Channel slack when testing for gamut, and the chroma precision of the search.
+channelTol = 1e-9
+chromaTol = 1e-6
+# Bracket half width around the table estimate. Most of the table is
+# within this of the exact boundary, the rest falls back to wider brackets.
+bracketWidth = 0.002
+
+def _insideFunc(l: float, h: float) -> Callable[[float], bool]:
+    """In gamut test for chroma at fixed l and h.
+
+    Along a line of constant l and h the cube root LMS values are linear in
+    chroma, so each test is three cubes and a matrix product.
+    """
+    a = multMatVec3(oklabToLmsMat, [l, 0, 0])
+    b = multMatVec3(oklabToLmsMat, [0, cos(h), sin(h)])
+    m = lmsToRgbMat
+    lo, hi = -channelTol, 1 + channelTol
+    def _inside(c: float) -> bool:
+        x = (a[0] + b[0]*c) ** 3
+        y = (a[1] + b[1]*c) ** 3
+        z = (a[2] + b[2]*c) ** 3
+        return (
+            lo <= m[0][0]*x + m[0][1]*y + m[0][2]*z <= hi and
+            lo <= m[1][0]*x + m[1][1]*y + m[1][2]*z <= hi and
+            lo <= m[2][0]*x + m[2][1]*y + m[2][2]*z <= hi)
+    return _inside
+
+def mapToGamut(lch: Vec, index: Optional[GamutIndex] = None) -> Vec:
+    """lch with chroma reduced until it is inside sRGB."""
+    l, c, h = lch
+    if l >= 1 or l <= 0:
+        return [clamp(l, 0, 1), 0.0, h]
+    inside = _insideFunc(l, h)
+    if inside(c):
+        return list(lch)
+    index = index or defaultIndex()
+    lo, hi = 0.0, c
+    if index:
+        estimate = index.maxChroma(l, h)
+        lo = clamp(estimate - bracketWidth, 0, c)
+        hi = clamp(estimate + bracketWidth, 0, c)
+        if not inside(lo):
+            lo, hi = 0.0, lo
+        elif inside(hi):
+            lo, hi = hi, c
+    while hi - lo > chromaTol:
+        mid = (lo + hi) / 2
+        if inside(mid):
+            lo = mid
+        else:
+            hi = mid
+    return [l, lo, h]
+
+def oklchToSrgb(lch: Vec, gamutMapping: str = 'clip') -> Vec:
+    if gamutMapping == 'chroma':
+        lch = mapToGamut(lch)
+    return convertColorSpace(lch, 'Oklch', 'sRGB')
@@ -1,6 +1,8 @@
 import re
+from functools import lru_cache
 from ctypes import CFUNCTYPE, c_int, c_uint, c_float, c_void_p, POINTER
 from pathlib import Path
+from typing import Dict, Tuple
 from PyQt5.QtGui import ( # type: ignore
     QOpenGLShader,
     QOpenGLShaderProgram,
@@ -64,25 +66,42 @@ def getVersionHeader(context: QOpenGLContext) -> str:
     versionHeader = f'#version {version[0]}{version[1]}0 {profile}\n{precision}'
     return versionHeader
 
-def createShader(shaderType: int, code: str) -> QOpenGLShader:
-    shader = QOpenGLShader(shaderType)
-    shader.compileSourceCode(code)
-    if not shader.isCompiled():
-        raise Exception(shader.log())
-    return shader
+@lru_cache(maxsize=None)
+def glAvailable() -> bool:
+    """Whether a context new enough for the selector shaders can be made.
+
+    The shaders need explicit output locations: OpenGL 3.3 or ES 3.0.
+    """
+    context = QOpenGLContext()
+    if not context.create():
+        return False
+    version = context.format().version()
+    return version >= ((3, 0) if context.isOpenGLES() else (3, 3))
 
 _includePat = re.compile(r'^#include "(\w+\.glsl)"', flags=re.MULTILINE)
 
-def loadShader(context: QOpenGLContext, name: Path) -> QOpenGLShader:
-    if name.suffix == '.vert':
-        shaderType = QOpenGLShader.Vertex
-    elif name.suffix == '.frag':
-        shaderType = QOpenGLShader.Fragment
-    else:
-        raise Exception(f'Unknown suffix in {str(name)}')
-    versionHeader = getVersionHeader(context)
+# Preprocessed sources keyed by path: (files read, their mtimes, code).
+_sourceCache: Dict[Path, Tuple[Tuple[Path, ...], Tuple[int, ...], str]] = {}
+
+def _mtimes(paths: Tuple[Path, ...]) -> Tuple[int, ...]:
+    return tuple(p.stat().st_mtime_ns for p in paths)
+
+def preprocessShader(name: Path) -> str:
+    """Source of name with #include lines expanded.
+
+    Cached for the process and reused while none of the files change.
+    """
+    cached = _sourceCache.get(name)
+    if cached:
+        paths, mtimes, code = cached
+        try:
+            if _mtimes(paths) == mtimes:
+                return code
+        except OSError:
+            pass
     with name.open() as f:
         code = f.read()
+    paths = [name]
     tokens = _includePat.split(code)
     for i in range(len(tokens)):
         if tokens[i].endswith('.glsl'):
@@ -90,12 +109,34 @@ def loadShader(context: QOpenGLContext, name: Path) -> QOpenGLShader:
             with includePath.open() as f:
                 includeCode = f.read()
             tokens[i] = includeCode
-    return createShader(shaderType, versionHeader + ''.join(tokens))
+            paths.append(includePath)
+    code = ''.join(tokens)
+    _sourceCache[name] = (tuple(paths), _mtimes(tuple(paths)), code)
+    return code
+
+def shaderType(name: Path) -> int:
+    if name.suffix == '.vert':
+        return QOpenGLShader.Vertex
+    elif name.suffix == '.frag':
+        return QOpenGLShader.Fragment
+    else:
+        raise Exception(f'Unknown suffix in {str(name)}')
 
-def createProgram(vertexShader: QOpenGLShader, fragmentShader: QOpenGLShader) -> QOpenGLShaderProgram:
+def loadProgram(context: QOpenGLContext, vertName: Path, fragName: Path) -> QOpenGLShaderProgram:
+    """Program from shader files, using Qt's program binary cache.
+
+    Cacheable shaders are only compiled when the linked binary is not
+    already in Qt's disk cache, which is keyed on the GL vendor, renderer,
+    version and the sources. Re-creating a context then skips compiling
+    and linking.
+    """
+    versionHeader = getVersionHeader(context)
     prog = QOpenGLShaderProgram()
-    prog.addShader(vertexShader)
-    prog.addShader(fragmentShader)
+    # Qt < 5.9 has no program binary cache.
+    addShader = getattr(prog, 'addCacheableShaderFromSourceCode', prog.addShaderFromSourceCode)
+    for name in (vertName, fragName):
+        if not addShader(shaderType(name), versionHeader + preprocessShader(name)):
+            raise Exception(prog.log())
     prog.link()
     if not prog.isLinked():
         raise Exception(prog.log())
@@ -1,29 +1,95 @@
 import krita as K # type: ignore
+from dataclasses import asdict, replace
 from pathlib import Path
-from .state import AppState
-from .app import HalfToneSelectorApp
-from .widget import HalfToneSelectorWidget
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional, Tuple
+from .startup import (
+    startupPhase,
+    finishBuild,
+)
+from . import instrument
+if TYPE_CHECKING:
+    # Imported on first show to keep plugin registration cheap.
+    from .state import AppState
+    from .journal import StateJournal
+    from .app import HalfToneSelectorApp
 
-def loadAppState() -> AppState:
-    # Data store so state isn't lost when Krita closes.
+def loadAppState() -> Tuple['AppState', 'StateJournal']:
+    from .journal import StateJournal
+    # Data store so state isn't lost when Krita closes or crashes.
     dataPath = Path(__file__).resolve().parent.parent / 'half_tone_selector_data.json'
-    s = AppState()
-    if dataPath.exists():
-        s = AppState.from_file(dataPath)
-    # Save when Krita closes.
+    journal = StateJournal(dataPath)
+    s = journal.load()
+    # Final snapshot when Krita closes.
     notifier = K.Krita.instance().notifier()
-    notifier.applicationClosing.connect(lambda: s.to_file(dataPath))
-    return s
+    notifier.applicationClosing.connect(journal.close)
+    return s, journal
+
+def createApp() -> 'HalfToneSelectorApp':
+    from .app import HalfToneSelectorApp
+    s, journal = loadAppState()
+    # Coalesce state callbacks to once per event loop turn.
+    app = HalfToneSelectorApp(s, schedule=lambda f: K.QTimer.singleShot(0, f))
+    journal.attach(app)
+    path = instrument.dumpPath()
+    if path:
+        notifier = K.Krita.instance().notifier()
+        notifier.applicationClosing.connect(lambda: instrument.dump(path, instrumentExtra(app)))
+    return app
+
+def instrumentExtra(app: 'HalfToneSelectorApp') -> Dict[str, Any]:
+    """Callback timings to save alongside the instrument counters."""
+    return {'callbacks': [asdict(stats) for stats in app.callbacks.stats()]}
 
 class HalfToneSelector(K.DockWidget):
-    def __init__(self, app: HalfToneSelectorApp) -> None:
+    """Docker shell. State and widgets are built on first show."""
+    def __init__(self, getApp: Callable[[], 'HalfToneSelectorApp']) -> None:
         super().__init__()
-        self.app = app
+        self._getApp = getApp
+        self.app: Optional['HalfToneSelectorApp'] = None
         self.setWindowTitle('Half Tone Selector')
-        self._appWidget = HalfToneSelectorWidget(app)
-        self.setWidget(self._appWidget)
 
-        app.registerCallback(['visible'], self.handleVisible)
+    def showEvent(self, event) -> None:
+        if self.app is None:
+            self._build()
+        super().showEvent(event)
+
+    def _build(self) -> None:
+        with startupPhase('loadState'):
+            self.app = self._getApp()
+        if self.app.s.gamutMapping == 'chroma':
+            with startupPhase('gamutIndex'):
+                # Loaded, or built the first time, here instead of on the
+                # first chroma mapped color. Clipping never needs it.
+                from .gamut import defaultIndex
+                defaultIndex()
+        with startupPhase('importWidgets'):
+            from .widget import HalfToneSelectorWidget
+        with startupPhase('buildWidgets'):
+            self._appWidget = HalfToneSelectorWidget(self.app)
+            self.setWidget(self._appWidget)
+        self.app.registerCallback(['visible'], self.handleVisible)
+        self._addInstrumentActions()
+        # Reports once the selectors' initializeGL has run too.
+        finishBuild()
+
+    def _addInstrumentActions(self) -> None:
+        toggle = K.QAction('Instrument hot paths', self)
+        toggle.setCheckable(True)
+        toggle.setChecked(instrument.isEnabled())
+        toggle.toggled.connect(instrument.setEnabled)
+        save = K.QAction('Save instrumentation...', self)
+        save.triggered.connect(self._saveInstrumentation)
+        reset = K.QAction('Reset instrumentation', self)
+        reset.triggered.connect(instrument.reset)
+        reset.triggered.connect(self.app.callbacks.resetStats)
+        self.addActions([toggle, save, reset])
+        self.setContextMenuPolicy(K.Qt.ActionsContextMenu)
+
+    def _saveInstrumentation(self) -> None:
+        path, _ = K.QFileDialog.getSaveFileName(
+            self, 'Save instrumentation', 'half_tone_selector_instrument.json', 'JSON (*.json)')
+        if path:
+            instrument.dump(Path(path), instrumentExtra(self.app))
 
     # notifies when views are added or removed
     def canvasChanged(self, canvas):
@@ -36,17 +102,23 @@ class HalfToneSelector(K.DockWidget):
         h = self.app.s.visibleMeta.height
         if w and h:
             self.resize(w, h)
-        self.app.s.visibleMeta.width = tempWidth
-        self.app.s.visibleMeta.height = tempHeight
+        self.app.setState(visibleMeta=replace(
+            self.app.s.visibleMeta, width=tempWidth, height=tempHeight))
 
     @staticmethod
     def addToKrita() -> None:
-        s = loadAppState()
-        app = HalfToneSelectorApp(s)
-
-        half_tone_selector_factory = K.DockWidgetFactory(
-            'half_tone_selector',
-            K.DockWidgetFactoryBase.DockRight,
-            lambda: HalfToneSelector(app))
-        instance = K.Krita.instance()
-        instance.addDockWidgetFactory(half_tone_selector_factory)
+        with startupPhase('register'):
+            app = None
+            def getApp():
+                # Shared by the dockers of every window.
+                nonlocal app
+                if app is None:
+                    app = createApp()
+                return app
+
+            half_tone_selector_factory = K.DockWidgetFactory(
+                'half_tone_selector',
+                K.DockWidgetFactoryBase.DockRight,
+                lambda: HalfToneSelector(getApp))
+            instance = K.Krita.instance()
+            instance.addDockWidgetFactory(half_tone_selector_factory)
@@ -0,0 +1,128 @@
+"""
+Call counts and timings for hot paths.
+
+Off by default. Set HALF_TONE_SELECTOR_INSTRUMENT=N with N > 0 to enable
+it, timing one in N calls of each counter (1 times every call). Calls are always
+counted, and estimatedTime scales the sampled time up to all calls. Set
+HALF_TONE_SELECTOR_INSTRUMENT_DUMP to a path to write the counters as
+JSON when Krita closes. The docker's context menu can also toggle it and
+save a dump.
+
+While off, an instrumented function costs one extra call and a flag
+check.
+"""
+import json
+import os
+import time
+from dataclasses import dataclass
+from functools import wraps
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Optional,
+    TypeVar,
+)
+
+F = TypeVar('F', bound=Callable[..., Any])
+
+@dataclass
+class Counter:
+    calls: int = 0
+    sampled: int = 0
+    sampledTime: float = 0.0
+
+    @property
+    def estimatedTime(self) -> float:
+        return self.sampledTime * self.calls / self.sampled if self.sampled else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'calls': self.calls,
+            'sampled': self.sampled,
+            'sampledTime': self.sampledTime,
+            'estimatedTime': self.estimatedTime,
+        }
+
+counters: Dict[str, Counter] = {}
+_enabled = False
+_sampleEvery = 1
+
+def configure(enabled: bool, sampleEvery: int = 1) -> None:
+    global _enabled, _sampleEvery
+    if sampleEvery < 1:
+        raise ValueError('sampleEvery must be at least 1.')
+    _enabled = enabled
+    _sampleEvery = sampleEvery
+
+def setEnabled(enabled: bool) -> None:
+    """Turn counting on or off, keeping the sampling rate."""
+    global _enabled
+    _enabled = enabled
+
+def isEnabled() -> bool:
+    return _enabled
+
+def reset() -> None:
+    counters.clear()
+
+def instrumented(name: str, key: Optional[Callable[..., str]] = None) -> Callable[[F], F]:
+    """Count and time calls of the decorated function under name.
+
+    key(*args, **kwargs) splits the counter, e.g. by conversion path.
+    """
+    def decorator(func: F) -> F:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            fullName = f'{name}:{key(*args, **kwargs)}' if key else name
+            counter = counters.get(fullName)
+            if counter is None:
+                counter = counters[fullName] = Counter()
+            counter.calls += 1
+            if counter.calls % _sampleEvery:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                counter.sampled += 1
+                counter.sampledTime += time.perf_counter() - start
+        return wrapper # type: ignore
+    return decorator
+
+def byClass(self, *args, **kwargs) -> str:
+    """key for methods, splitting counters by the instance's class."""
+    return type(self).__name__
+
+def snapshot(extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Counters by name, most estimated time first."""
+    ordered = sorted(counters.items(), key=lambda kv: kv[1].estimatedTime, reverse=True)
+    d = {
+        'sampleEvery': _sampleEvery,
+        'counters': {name: counter.to_dict() for name, counter in ordered},
+    }
+    d.update(extra or {})
+    return d
+
+def dump(path: Path, extra: Optional[Dict[str, Any]] = None) -> None:
+    with path.open('w') as f:
+        json.dump(snapshot(extra), f, indent=2)
+
+def dumpPath() -> Optional[Path]:
+    path = os.environ.get('HALF_TONE_SELECTOR_INSTRUMENT_DUMP')
+    return Path(path) if path else None
+
+def _configureFromEnv() -> None:
+    """A positive integer enables sampling one in that many calls. 0,
+    empty and anything else leave it off."""
+    try:
+        sampleEvery = int(os.environ.get('HALF_TONE_SELECTOR_INSTRUMENT', ''))
+    except ValueError:
+        return
+    if sampleEvery > 0:
+        configure(True, sampleEvery)
+
+_configureFromEnv()
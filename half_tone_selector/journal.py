@@ -0,0 +1,180 @@
+"""
+Crash-safe persistence for AppState.
+
+The snapshot is the usual half_tone_selector_data.json. Changes since the
+snapshot are appended to a JSONL journal next to it by a background
+thread, one entry per change:
+
+    {"seq": 12, "op": "set", "field": "light", "value": [0.5, 0.1, 1.2]}
+    {"seq": 13, "op": "add", "set": {"name": "", "tones": [...]}}
+    {"seq": 14, "op": "addMany", "sets": [{"name": "", "tones": [...]}, ...]}
+    {"seq": 15, "op": "remove", "index": 3}
+    {"seq": 16, "op": "rename", "index": 2, "name": "Skin"}
+
+On startup the snapshot is loaded with AppState.from_dict (so legacy files
+still load) and the journal is replayed on top. Every compactEvery entries
+the state is folded into a new snapshot and the journal is truncated. The
+snapshot records the last seq it contains, so entries that survive a crash
+between the two steps are skipped on replay.
+"""
+import json
+import os
+import queue
+import threading
+from pathlib import Path
+from typing import (
+    Any,
+    Dict,
+    Optional,
+    TextIO,
+)
+from .state import (
+    AppState,
+    HalfToneSet,
+)
+from .app import HalfToneSelectorApp
+
+# Fields changed through setState or the visible property.
+journaledFields = ['light', 'dark', 'k', 'count', 'cos', 'gamutMapping', 'visible', 'visibleMeta']
+
+def applyEntry(s: AppState, entry: Dict[str, Any]) -> None:
+    op = entry['op']
+    if op == 'set':
+        s.deserializeField(entry['field'], entry['value'])
+    elif op == 'add':
+        s.halfTones.append(HalfToneSet.from_dict(entry['set']))
+    elif op == 'addMany':
+        s.halfTones.extend(HalfToneSet.from_dict(d) for d in entry['sets'])
+    elif op == 'remove':
+        s.halfTones.pop(entry['index'])
+    elif op == 'rename':
+        s.halfTones[entry['index']].name = entry['name']
+    else:
+        raise ValueError(f'Unknown journal op: {op}')
+
+class StateJournal:
+    def __init__(
+            self,
+            snapshotPath: Path,
+            journalPath: Optional[Path] = None,
+            compactEvery: int = 1000,
+            ) -> None:
+        self.snapshotPath = snapshotPath
+        self.journalPath = journalPath or snapshotPath.with_suffix('.journal')
+        self.compactEvery = compactEvery
+        self._app: Optional[HalfToneSelectorApp] = None
+        self._seq = 0
+        self._pending = 0
+        self._queue: 'queue.Queue[Optional[tuple]]' = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    def load(self) -> AppState:
+        """Snapshot plus every journal entry written after it."""
+        s = AppState()
+        if self.snapshotPath.exists():
+            with self.snapshotPath.open() as f:
+                d = json.load(f)
+            s = AppState.from_dict(d)
+            if isinstance(d, dict):
+                self._seq = d.get('journalSeq', 0)
+        if self.journalPath.exists():
+            with self.journalPath.open() as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Torn write from a crash, nothing valid follows.
+                        break
+                    if entry['seq'] <= self._seq:
+                        continue
+                    applyEntry(s, entry)
+                    self._seq = entry['seq']
+            # Fold the replayed entries (and any torn tail) into a new
+            # snapshot once the writer starts.
+            self._pending = self.compactEvery
+        return s
+
+    def attach(self, app: HalfToneSelectorApp) -> None:
+        """Journal app's changes from now on."""
+        self._app = app
+        for name in journaledFields:
+            app.registerCallback([name], lambda name=name: self._recordField(name))
+        app.registerCallback(['addHalfToneSet'], self._recordAdd)
+        app.registerCallback(['removeHalfToneSet'], self._recordRemove)
+        app.registerCallback(['renameHalfToneSet'], self._recordRename)
+        self._thread = threading.Thread(
+            target=self._run, name='half_tone_selector_journal', daemon=True)
+        self._thread.start()
+        if self._pending >= self.compactEvery:
+            self.compact()
+
+    def _recordField(self, name: str) -> None:
+        # The visible property lives in visibleMeta.
+        field = 'visibleMeta' if name == 'visible' else name
+        self.record({'op': 'set', 'field': field, 'value': self._app.s.serializeField(field)})
+
+    def _recordAdd(self, i: int, n: int) -> None:
+        sets = self._app.s.halfTones[i:i + n]
+        if n == 1:
+            self.record({'op': 'add', 'set': sets[0].to_dict()})
+        else:
+            self.record({'op': 'addMany', 'sets': [hts.to_dict() for hts in sets]})
+
+    def _recordRemove(self, i: int) -> None:
+        self.record({'op': 'remove', 'index': i})
+
+    def _recordRename(self, i: int) -> None:
+        self.record({'op': 'rename', 'index': i, 'name': self._app.s.halfTones[i].name})
+
+    def record(self, entry: Dict[str, Any]) -> None:
+        self._seq += 1
+        self._queue.put(('append', {'seq': self._seq, **entry}))
+        self._pending += 1
+        if self._pending >= self.compactEvery:
+            self.compact()
+
+    def compact(self) -> None:
+        """Queue a snapshot of the current state and truncate the journal."""
+        d = self._app.s.to_dict()
+        d['journalSeq'] = self._seq
+        self._queue.put(('snapshot', d))
+        self._pending = 0
+
+    def close(self) -> None:
+        """Write a final snapshot and wait for the writer to finish."""
+        if self._thread is None:
+            return
+        self.compact()
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def _writeSnapshot(self, d: dict) -> None:
+        temp = self.snapshotPath.with_suffix('.tmp')
+        with temp.open('w') as f:
+            f.write(json.dumps(d))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, self.snapshotPath)
+
+    def _run(self) -> None:
+        journal: TextIO = self.journalPath.open('a')
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                kind, payload = item
+                if kind == 'append':
+                    journal.write(json.dumps(payload))
+                    journal.write('\n')
+                    # Batch whatever else is queued into one flush.
+                    if self._queue.empty():
+                        journal.flush()
+                else:
+                    journal.flush()
+                    self._writeSnapshot(payload)
+                    journal.close()
+                    journal = self.journalPath.open('w')
+        finally:
+            journal.close()
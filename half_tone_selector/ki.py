@@ -9,6 +9,7 @@ from .matrix import (
 from .color import (
     convertColorSpace,
 )
+from .gamut import oklchToSrgb
 from krita import ( # type: ignore
     Krita,
     ManagedColor,
@@ -68,8 +69,8 @@ def scaleColor(color: QColor, scale: float, b: int = 0) -> QColor:
     scaledRgb = [round(clamp(x*scale + b, 0, 255)) for x in rgb]
     return QColor(*scaledRgb)
 
-def oklchToQColor(lch: Vec) -> QColor:
-    rgb = convertColorSpace(lch, 'Oklch', 'sRGB')
+def oklchToQColor(lch: Vec, gamutMapping: str = 'clip') -> QColor:
+    rgb = oklchToSrgb(lch, gamutMapping)
     c = QColor.fromRgbF(*rgb)
     return c
 
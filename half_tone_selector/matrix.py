@@ -164,6 +164,36 @@ def invertMat(mat: Mat) -> Mat:
     permuteMatCols(p, matInv)
     return matInv
 
+# Unrolled kernels for the 3x3 color matrices. They add in the same order
+# as the generic versions, so multiplication results are identical.
+def multMat3(m1: Mat, m2: Mat) -> Mat:
+    (a, b, c), (d, e, f), (g, h, i) = m1
+    (j, k, l), (m, n, o), (p, q, r) = m2
+    return [
+        [a*j + b*m + c*p, a*k + b*n + c*q, a*l + b*o + c*r],
+        [d*j + e*m + f*p, d*k + e*n + f*q, d*l + e*o + f*r],
+        [g*j + h*m + i*p, g*k + h*n + i*q, g*l + h*o + i*r],
+    ]
+
+def multMatVec3(mat: Mat, vec: Vec) -> Vec:
+    (a, b, c), (d, e, f), (g, h, i) = mat
+    x, y, z = vec
+    return [a*x + b*y + c*z, d*x + e*y + f*z, g*x + h*y + i*z]
+
+def invertMat3(mat: Mat) -> Mat:
+    """Closed-form inverse from the adjugate. Agrees with invertMat to
+    rounding for well-conditioned matrices."""
+    (a, b, c), (d, e, f), (g, h, i) = mat
+    A = e*i - f*h
+    B = f*g - d*i
+    C = d*h - e*g
+    det = a*A + b*B + c*C
+    return [
+        [A/det, (c*h - b*i)/det, (b*f - c*e)/det],
+        [B/det, (a*i - c*g)/det, (c*d - a*f)/det],
+        [C/det, (b*g - a*h)/det, (a*e - b*d)/det],
+    ]
+
 def transposeMat(mat: Mat) -> Mat:
     m = len(mat)
     n = len(mat[0])
@@ -1,71 +1,237 @@
-import xml.etree.ElementTree as ET
+import io
+from array import array
+from itertools import islice
+from math import pi
+from concurrent.futures import (
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
 from pathlib import Path
-from tempfile import TemporaryDirectory
-from typing import List
+from typing import (
+    BinaryIO,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+from xml.etree.ElementTree import (
+    Element,
+    iterparse,
+)
+from xml.sax.saxutils import escape
 from zipfile import ZipFile
-from .state import HalfToneSet
+from .matrix import Vec
 from .color import convertColorSpace
+from .state import (
+    HalfToneSet,
+    Tones,
+)
+from .gamut import oklchToSrgb
+from .instrument import instrumented
 
 mimetype = 'application/x-krita-palette'
 iccPath = Path(__file__).resolve().parent / 'icc/sRGB-elle-V2-srgbtrc.icc'
+columns = 12
 
+# What ElementTree escapes in attribute values besides &, < and >.
+_attrEntities = {'"': '&quot;', '\r': '&#13;', '\n': '&#10;', '\t': '&#09;'}
 
-def exportPalette(halfTones: List[HalfToneSet], name: str, path: Path) -> None:
-    with TemporaryDirectory() as temp:
-        _exportPalette(halfTones, name, path, temp)
+def _element(tag: str, attrs: Dict[str, str], empty: bool = True) -> str:
+    attrText = ''.join(f' {k}="{escape(v, _attrEntities)}"' for k, v in attrs.items())
+    return f'<{tag}{attrText} />' if empty else f'<{tag}{attrText}>'
 
-def _exportPalette(halfTones: List[HalfToneSet], name: str, path: Path, temp: Path) -> None:
-    tempPath = Path(temp)
-    mimetypePath = tempPath / 'mimetype'
-    profilesPath = tempPath / 'profiles.xml'
-    colorsetPath = tempPath / 'colorset.xml'
-
-    with mimetypePath.open('w') as f:
-        f.write(mimetype)
-
-    profiles = ET.Element('Profiles')
+def _profilesXml() -> str:
     profileAttrs = {
         'colorModelId': 'RGBA',
         'colorDepthId': 'U8',
         'filename': iccPath.name,
         'name': iccPath.name,
     }
-    profile = ET.SubElement(profiles, 'Profile', profileAttrs)
-    with profilesPath.open('w') as f:
-        f.write(ET.tostring(profiles, encoding='unicode'))
+    return f'<Profiles>{_element("Profile", profileAttrs)}</Profiles>'
+
+# Every value here is numeric or fixed, so nothing needs escaping.
+_entryTemplate = (
+    '<ColorSetEntry id="{id}" name="Color {id}" bitdepth="U8" spot="false">'
+    f'<RGB space="{iccPath.name}" r="{{r}}" g="{{g}}" b="{{b}}" />'
+    '<Position row="{row}" column="{column}" />'
+    '</ColorSetEntry>'
+)
+
+# Sets per batch conversion when exporting.
+_exportChunk = 1024
+
+def _srgbTones(halfTones: Iterable[HalfToneSet], gamutMapping: str) -> Iterator[List[Vec]]:
+    """sRGB tones of each set.
+
+    With NumPy, the tones of _exportChunk sets at a time are converted in
+    one batch straight from their array views.
+    """
+    try:
+        import numpy as np
+        from .batch import oklchToSrgbBatch
+    except ModuleNotFoundError:
+        for ht in halfTones:
+            yield [oklchToSrgb(t, gamutMapping) for t in ht.tones]
+        return
+    sets = iter(halfTones)
+    while True:
+        chunk = [ht.tones for ht in islice(sets, _exportChunk)]
+        if not chunk:
+            return
+        lchs = np.concatenate([tones.asArray() for tones in chunk])
+        rgbs = oklchToSrgbBatch(lchs, gamutMapping).tolist()
+        start = 0
+        for tones in chunk:
+            yield rgbs[start:start + len(tones)]
+            start += len(tones)
+
+def _colorSetEntries(halfTones: Iterable[HalfToneSet], gamutMapping: str) -> Iterable[str]:
+    for i, rgbs in enumerate(_srgbTones(halfTones, gamutMapping)):
+        for j, (r, g, b) in enumerate(rgbs):
+            yield _entryTemplate.format(id=columns*i+j, r=r, g=g, b=b, row=i, column=j)
+
+def writePalette(
+        halfTones: Iterable[HalfToneSet],
+        name: str,
+        file: Union[Path, BinaryIO],
+        rows: Optional[int] = None,
+        gamutMapping: str = 'clip',
+        ) -> None:
+    """Stream a .kpl archive into file.
 
+    Entries are written straight into the zip as they are converted, so
+    memory stays bounded for any number of sets. rows is required when
+    halfTones has no len(), e.g. a generator.
+    """
+    if rows is None:
+        rows = len(halfTones) # type: ignore
     colorsetAttrs = {
         'name': name,
         'version': '2.0',
         'comment': '',
-        'rows': str(len(halfTones)),
-        'columns': '12',
+        'rows': str(rows),
+        'columns': str(columns),
     }
-    colorset = ET.Element('ColorSet', colorsetAttrs)
-    for i, ht in enumerate(halfTones):
-        for j, t in enumerate(ht.tones):
-            rgb = convertColorSpace(t, 'Oklch', 'sRGB')
-            entryAttrs = {
-                'id': f'{12*i+j}',
-                'name': f'Color {12*i+j}',
-                'bitdepth': 'U8',
-                'spot': 'false',
-            }
-            colorsetEntry = ET.SubElement(colorset, 'ColorSetEntry', entryAttrs)
-            rgbElemAttrs = {
-                'space': iccPath.name,
-                'r': str(rgb[0]),
-                'g': str(rgb[1]),
-                'b': str(rgb[2]),
-            }
-            rgbElem = ET.SubElement(colorsetEntry, 'RGB', rgbElemAttrs)
-            positionAttrs = {'row': str(i), 'column': str(j)}
-            position = ET.SubElement(colorsetEntry, 'Position', positionAttrs)
-    with colorsetPath.open('w') as f:
-        f.write(ET.tostring(colorset, encoding='unicode'))
-
-    with ZipFile(path / f'{name}.kpl', 'w') as f:
-        f.write(filename=mimetypePath, arcname=mimetypePath.name)
+    with ZipFile(file, 'w') as f:
+        f.writestr('mimetype', mimetype)
         f.write(filename=iccPath, arcname=iccPath.name)
-        f.write(filename=profilesPath, arcname=profilesPath.name)
-        f.write(filename=colorsetPath, arcname=colorsetPath.name)
+        f.writestr('profiles.xml', _profilesXml())
+        entries = iter(_colorSetEntries(halfTones, gamutMapping))
+        first = next(entries, None)
+        with io.TextIOWrapper(f.open('colorset.xml', 'w'), encoding='utf-8') as colorset:
+            # Self-closed when empty, like ElementTree.
+            colorset.write(_element('ColorSet', colorsetAttrs, empty=first is None))
+            if first is not None:
+                colorset.write(first)
+                for entry in entries:
+                    colorset.write(entry)
+                colorset.write('</ColorSet>')
+
+@instrumented('exportPalette')
+def exportPalette(
+        halfTones: Iterable[HalfToneSet],
+        name: str,
+        path: Path,
+        rows: Optional[int] = None,
+        gamutMapping: str = 'clip',
+        ) -> None:
+    writePalette(halfTones, name, path / f'{name}.kpl', rows, gamutMapping)
+
+def _srgbToOklch(rgbs: List[Vec]) -> List[Vec]:
+    """sRGB to Oklch in one batch when NumPy is available."""
+    try:
+        import numpy as np
+    except ModuleNotFoundError:
+        return [convertColorSpace(rgb, 'sRGB', 'Oklch') for rgb in rgbs]
+    if not rgbs:
+        return []
+    return convertColorSpace(np.array(rgbs), 'sRGB', 'Oklch').tolist()
+
+@instrumented('readPalette')
+def readPalette(file: Union[Path, BinaryIO]) -> List[HalfToneSet]:
+    """Half tone sets of a .kpl archive, one per palette row.
+
+    colorset.xml is parsed as a stream and only RGB entries are read.
+    Entries are grouped by their Position row and ordered by column, and
+    entries without a Position fill rows in order. Rows of groups follow
+    the rows before them.
+    """
+    name = ''
+    rowLength = columns
+    group = ''
+    groupEntries = 0
+    # (group, row) -> [(column, color index)] in document order.
+    rows: Dict[Tuple[str, int], List[Tuple[int, int]]] = {}
+    groupOrder: Dict[str, int] = {'': 0}
+    rgbs: List[Vec] = []
+    # Open elements, so read entries can be dropped from their parent.
+    parents: List[Element] = []
+    with ZipFile(file) as z, z.open('colorset.xml') as f:
+        for event, elem in iterparse(f, ('start', 'end')):
+            if event == 'start':
+                parents.append(elem)
+                if elem.tag == 'ColorSet':
+                    name = elem.get('name', '')
+                    rowLength = int(elem.get('columns') or columns)
+                elif elem.tag == 'Group':
+                    group = elem.get('name', '')
+                    groupOrder.setdefault(group, len(groupOrder))
+                    groupEntries = 0
+                continue
+            parents.pop()
+            if elem.tag == 'ColorSetEntry':
+                rgb = elem.find('RGB')
+                pos = elem.find('Position')
+                if rgb is not None:
+                    if pos is not None:
+                        row, column = int(pos.get('row', 0)), int(pos.get('column', 0))
+                    else:
+                        row, column = divmod(groupEntries, rowLength)
+                    rows.setdefault((group, row), []).append((column, len(rgbs)))
+                    rgbs.append([float(rgb.get(c, 0)) for c in 'rgb'])
+                groupEntries += 1
+                if parents:
+                    parents[-1].remove(elem)
+            elif elem.tag == 'Group':
+                group = ''
+
+    lchs = _srgbToOklch(rgbs)
+    sets = []
+    for group, row in sorted(rows, key=lambda k: (groupOrder[k[0]], k[1])):
+        data = array('d')
+        for _, i in sorted(rows[group, row]):
+            l, c, h = lchs[i]
+            data.extend((l, c, h % (2*pi)))
+        setName = ' '.join(x for x in [name, group, str(row + 1)] if x)
+        sets.append(HalfToneSet(name=setName, tones=Tones.fromBuffer(data)))
+    return sets
+
+def paletteFiles(path: Path) -> List[Path]:
+    """path itself, or the .kpl files of a directory."""
+    return sorted(path.glob('*.kpl')) if path.is_dir() else [path]
+
+def importPalettes(
+        paths: Iterable[Path],
+        workers: int = 1,
+        processes: bool = False,
+        ) -> Iterator[HalfToneSet]:
+    """Sets of every palette in paths, in order.
+
+    Directories are expanded to their .kpl files. With workers > 1 the
+    palettes are read across a thread pool, or a process pool when
+    processes is set. Inside Krita use threads, since sys.executable is
+    Krita rather than a Python that can start workers.
+    """
+    files = [f for path in paths for f in paletteFiles(path)]
+    if workers <= 1 or len(files) <= 1:
+        for f in files:
+            yield from readPalette(f)
+        return
+    pool: Executor = (ProcessPoolExecutor if processes else ThreadPoolExecutor)(max_workers=workers)
+    with pool:
+        for sets in pool.map(readPalette, files):
+            yield from sets
@@ -0,0 +1,245 @@
+"""
+Model/view palette of the saved half tone sets.
+
+Only the rows in view are painted, so opening a library of thousands of
+sets costs one QListView instead of a widget tree per set. The model
+follows the app's addHalfToneSet, removeHalfToneSet and renameHalfToneSet
+callbacks one row at a time. The tone closest to the foreground color is
+outlined, found with a ToneIndex each time the color changes.
+"""
+from typing import (
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+from PyQt5.QtCore import ( # type: ignore
+    Qt,
+    QAbstractListModel,
+    QEvent,
+    QModelIndex,
+    QRect,
+    QSize,
+    QTimer,
+)
+from PyQt5.QtGui import ( # type: ignore
+    QColor,
+    QFont,
+    QFontMetrics,
+)
+from PyQt5.QtWidgets import ( # type: ignore
+    QAbstractItemView,
+    QLineEdit,
+    QListView,
+    QStyledItemDelegate,
+)
+from krita import Krita # type: ignore
+from .app import HalfToneSelectorApp
+from .color import convertColorSpace
+from .state import HalfToneSet
+from .ki import (
+    getFGColor,
+    setFGColor,
+)
+from .spatial import ToneIndex
+from .toneStrip import (
+    patchHeight,
+    patchRects,
+    paintTones,
+    toneColors,
+)
+
+HalfToneSetRole = Qt.UserRole + 1
+
+class HalfToneListModel(QAbstractListModel):
+    """app.s.halfTones as a list model. The display role is the set name."""
+    def __init__(self, app: HalfToneSelectorApp, parent=None) -> None:
+        super().__init__(parent)
+        self._app = app
+        app.registerCallback(['aboutToAddHalfToneSet'], self._handleAboutToAdd)
+        app.registerCallback(['addHalfToneSet'], lambda i, n: self.endInsertRows())
+        app.registerCallback(['aboutToRemoveHalfToneSet'], self._handleAboutToRemove)
+        app.registerCallback(['removeHalfToneSet'], lambda i: self.endRemoveRows())
+        app.registerCallback(['renameHalfToneSet'], self._handleRename)
+
+    # begin* runs before the app changes the list and end* after, so views
+    # see the old rows until the change is done.
+    def _handleAboutToAdd(self, i: int, n: int) -> None:
+        self.beginInsertRows(QModelIndex(), i, i + n - 1)
+
+    def _handleAboutToRemove(self, i: int) -> None:
+        self.beginRemoveRows(QModelIndex(), i, i)
+
+    def _handleRename(self, i: int) -> None:
+        index = self.index(i)
+        self.dataChanged.emit(index, index, [Qt.DisplayRole, Qt.EditRole])
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._app.s.halfTones)
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._app.s.halfTones):
+            return None
+        hts = self._app.s.halfTones[index.row()]
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return hts.name
+        elif role == HalfToneSetRole:
+            return hts
+        return None
+
+    def setData(self, index: QModelIndex, value, role: int = Qt.EditRole) -> bool:
+        if role != Qt.EditRole or not index.isValid():
+            return False
+        # Goes through the app so the rename is journaled and signalled.
+        self._app.renameHalfToneSet(self._app.s.halfTones[index.row()], value)
+        return True
+
+    def flags(self, index: QModelIndex):
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsEditable
+
+class _RowRects(NamedTuple):
+    main: QRect
+    patches: QRect
+    name: QRect
+    delete: Optional[QRect]
+
+class HalfToneDelegate(QStyledItemDelegate):
+    """Paints a set as its tone patches, name and delete button.
+
+    Clicking a patch sets the foreground color, clicking the delete button
+    removes the set and double clicking the name edits it.
+    """
+    deleteSize = 24
+    rowSpacing = 5
+
+    def __init__(self, app: HalfToneSelectorApp, parent=None) -> None:
+        super().__init__(parent)
+        self._app = app
+        self._font = QFont()
+        self._font.setPointSize(8)
+        self._nameHeight = QFontMetrics(self._font).height()
+        self._deleteIcon = None
+        self.nearest: Optional[Tuple[HalfToneSet, int]] = None
+
+    def _rects(self, option) -> _RowRects:
+        rect = option.rect.adjusted(0, 0, 0, -self.rowSpacing)
+        delete = None
+        main = QRect(rect)
+        if self._app.visible:
+            delete = QRect(
+                rect.right() - self.deleteSize + 1, rect.top(),
+                self.deleteSize, self.deleteSize)
+            main.setRight(delete.left() - 2)
+        inner = main.adjusted(5, 2, -5, -2)
+        patches = QRect(inner.left(), inner.top(), inner.width(), patchHeight + 2)
+        name = QRect(inner.left(), patches.bottom() + 2, inner.width(), self._nameHeight)
+        return _RowRects(main, patches, name, delete)
+
+    def _colors(self, index: QModelIndex) -> List[QColor]:
+        hts = index.data(HalfToneSetRole)
+        return toneColors(hts.tones.astuple(), self._app.s.gamutMapping)
+
+    def sizeHint(self, option, index: QModelIndex) -> QSize:
+        # Uniform, so the view can lay out rows without asking each one.
+        return QSize(0, 2 + patchHeight + 2 + 2 + self._nameHeight + 2 + self.rowSpacing)
+
+    def paint(self, painter, option, index: QModelIndex) -> None:
+        style = self._app.style
+        rects = self._rects(option)
+        painter.save()
+        painter.fillRect(rects.main, style['label'])
+        hovered = -1
+        if self.nearest and self.nearest[0] is index.data(HalfToneSetRole):
+            hovered = self.nearest[1]
+        paintTones(painter, rects.patches, self._colors(index), style['background'], hovered)
+        name = index.data(Qt.DisplayRole)
+        painter.setFont(self._font)
+        if name:
+            painter.setPen(option.palette.text().color())
+            painter.drawText(rects.name, Qt.AlignLeft | Qt.AlignVCenter, name)
+        elif self._app.visible:
+            painter.setPen(option.palette.placeholderText().color())
+            painter.drawText(rects.name, Qt.AlignLeft | Qt.AlignVCenter, 'Name')
+        if rects.delete:
+            if self._deleteIcon is None:
+                self._deleteIcon = Krita.instance().icon('deletelayer')
+            self._deleteIcon.paint(painter, rects.delete.adjusted(4, 4, -4, -4))
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index: QModelIndex) -> bool:
+        if event.type() == QEvent.MouseButtonRelease and event.button() == Qt.LeftButton:
+            rects = self._rects(option)
+            pos = event.pos()
+            if rects.delete and rects.delete.contains(pos):
+                self._app.removeHalfToneSet(index.data(HalfToneSetRole))
+                return True
+            colors = self._colors(index)
+            for rect, color in zip(patchRects(rects.patches, len(colors)), colors):
+                if rect.contains(pos):
+                    setFGColor(color)
+                    return True
+        return super().editorEvent(event, model, option, index)
+
+    def createEditor(self, parent, option, index: QModelIndex) -> QLineEdit:
+        line = QLineEdit(parent)
+        line.setFont(self._font)
+        line.setPlaceholderText('Name')
+        line.setFrame(False)
+        return line
+
+    def updateEditorGeometry(self, editor, option, index: QModelIndex) -> None:
+        editor.setGeometry(self._rects(option).name)
+
+def _trackForeground(app: HalfToneSelectorApp, view: QListView, delegate: HalfToneDelegate) -> None:
+    """Outline the saved tone closest to the foreground color.
+
+    Krita has no signal for foreground changes, so it is polled and the
+    index is only queried when the color differs from the last poll.
+    """
+    index = ToneIndex()
+    index.attach(app)
+    lastColor = None
+
+    def update() -> None:
+        nonlocal lastColor
+        color = getFGColor() if view.isVisible() else None
+        if color is None or color == lastColor:
+            return
+        lastColor = color
+        lab = convertColorSpace(list(color.getRgbF()[:3]), 'sRGB', 'Oklab')
+        found = index.nearest(lab)
+        nearest = (found[0][1], found[0][2]) if found else None
+        if nearest != delegate.nearest:
+            delegate.nearest = nearest
+            view.viewport().update()
+
+    def reset(*args) -> None:
+        # Saved sets changed, so the closest tone may have too.
+        nonlocal lastColor
+        lastColor = None
+
+    app.registerCallback(['addHalfToneSet', 'removeHalfToneSet'], reset)
+    timer = QTimer(view)
+    timer.timeout.connect(update)
+    timer.start(100)
+
+def paletteView(app: HalfToneSelectorApp) -> QListView:
+    view = QListView()
+    # Parented to the view, which does not take ownership of either.
+    delegate = HalfToneDelegate(app, view)
+    view.setModel(HalfToneListModel(app, view))
+    view.setItemDelegate(delegate)
+    view.setUniformItemSizes(True)
+    view.setSelectionMode(QAbstractItemView.NoSelection)
+    view.setEditTriggers(QAbstractItemView.DoubleClicked | QAbstractItemView.EditKeyPressed)
+    view.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+    view.setFrameShape(QListView.NoFrame)
+    view.setStyleSheet(f'''
+        QListView {{
+            background-color: {app.style['background'].name()};
+        }}
+    ''')
+    # Delete buttons and placeholders depend on these.
+    app.registerCallback(['visible', 'gamutMapping'], view.viewport().update)
+    _trackForeground(app, view, delegate)
+    return view
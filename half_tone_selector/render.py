@@ -0,0 +1,249 @@
+"""
+Software versions of the selector shaders.
+
+chromaHueImage reproduces lab1.frag + lab2.frag and lightnessImage
+reproduces lab3.frag with the array color path, returning (H, W, 3) uint8
+sRGB arrays with the top row first. Used when OpenGL is unavailable and
+for rendering the selectors headless.
+
+The gamut pattern only depends on lightness and size, so it is rendered
+in tiles that are cached for the last couple of lightness values.
+Switching between the light and dark colors or moving within a
+chroma/hue plane only redraws the handles.
+"""
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Optional, Sequence, Tuple
+import numpy as np
+from .batch import (
+    Arr,
+    convertColorSpaceBatch,
+    fromLinearRgb,
+    fromLinearRgbLut,
+)
+
+tileSize = 64
+
+def _fragCoords(x0: int, y0: int, w: int, h: int, height: int) -> Tuple[Arr, Arr]:
+    """gl_FragCoord of image pixels. Image rows go down, GL y goes up."""
+    x = np.arange(x0, x0 + w) + 0.5
+    y = height - (np.arange(y0, y0 + h) + 0.5)
+    return np.meshgrid(x, y)
+
+def _mix(a: Arr, b, t: Arr) -> Arr:
+    return a + (np.asarray(b) - a) * t[..., None]
+
+def _outline(r: Arr, width: float, scale: float) -> Arr:
+    innerEdge = np.clip(r * scale, 0, 1)
+    outerEdge = np.clip((r - width) * scale, 0, 1)
+    return innerEdge * (1 - outerEdge)
+
+def _circle(pos: Sequence[float], x: Arr, y: Arr, radius: float, scale: float) -> Arr:
+    dist = np.hypot(x - pos[0], y - pos[1])
+    return 1 - np.clip((dist - radius) * scale, 0, 1)
+
+def _circleOutline(pos: Sequence[float], x: Arr, y: Arr, radius: float, width: float, scale: float) -> Arr:
+    dist = np.hypot(x - pos[0], y - pos[1])
+    return _outline(dist - radius, width, scale)
+
+def _clampedSrgb(lab: Arr) -> Tuple[Arr, Arr]:
+    """sRGB of lab clamped to gamut, and the Oklab distance moved.
+
+    The sRGB transfer uses the lookup table, which is well below 8 bit
+    precision.
+    """
+    rgb = convertColorSpaceBatch(lab, 'Oklab', 'LinearRGB')
+    clampedRgb = np.clip(rgb, 0, 1)
+    outside = np.any(rgb != clampedRgb, axis=-1)
+    d = np.zeros(outside.shape)
+    clampedLab = convertColorSpaceBatch(clampedRgb[outside], 'LinearRGB', 'Oklab')
+    d[outside] = np.linalg.norm(lab[outside] - clampedLab, axis=-1)
+    return fromLinearRgbLut(clampedRgb), d
+
+def _oklabToSrgb(lab: Sequence[float]) -> Arr:
+    return fromLinearRgb(convertColorSpaceBatch(np.array(lab), 'Oklab', 'LinearRGB'))
+
+def _outlineColor(lightness: float) -> float:
+    return 1.0 if lightness < 0.5 else 0.0
+
+def _toBytes(srgb: Arr) -> Arr:
+    x = srgb * 255
+    np.rint(x, out=x)
+    np.clip(x, 0, 255, out=x)
+    return x.astype(np.uint8)
+
+# Tiles of the last few (lightness, width, height), enough to switch
+# between the light and dark colors. Dragging lightness only ever keeps
+# this many frames of tiles.
+_patternFrames = 2
+_tileCache: 'OrderedDict[Tuple[float, int, int], Dict[Tuple[int, int], Arr]]' = OrderedDict()
+
+def _patternTile(lightness: float, width: int, height: int, tx: int, ty: int) -> Arr:
+    key = (lightness, width, height)
+    tiles = _tileCache.get(key)
+    if tiles is None:
+        tiles = _tileCache[key] = {}
+        while len(_tileCache) > _patternFrames:
+            _tileCache.popitem(last=False)
+    else:
+        _tileCache.move_to_end(key)
+    tile = tiles.get((tx, ty))
+    if tile is None:
+        tile = tiles[tx, ty] = _renderPatternTile(lightness, width, height, tx, ty)
+    return tile
+
+def _renderPatternTile(lightness: float, width: int, height: int, tx: int, ty: int) -> Arr:
+    """lab1.frag's color output for one tile."""
+    x0, y0 = tx * tileSize, ty * tileSize
+    w, h = min(tileSize, width - x0), min(tileSize, height - y0)
+    x, y = _fragCoords(x0, y0, w, h, height)
+    s = min(width, height) / 2
+    lab = np.stack([
+        np.full(x.shape, lightness),
+        0.4 * (x - width / 2) / s,
+        0.4 * (y - height / 2) / s,
+    ], axis=-1)
+    srgb, d = _clampedSrgb(lab)
+    tile = _mix(srgb, _outlineColor(lightness), _outline(2.5*d, 0.0025, s) * 0.2)
+    tile.flags.writeable = False
+    return tile
+
+def _tileInDisc(tx: int, ty: int, width: int, height: int, radius: float) -> bool:
+    s = min(width, height) / 2
+    x0, y0 = tx * tileSize, ty * tileSize
+    dx = max(x0 - width / 2, 0, width / 2 - (x0 + tileSize))
+    dy = max(y0 - height / 2, 0, height / 2 - (y0 + tileSize))
+    return dx*dx + dy*dy <= (radius * s) ** 2
+
+def gamutPattern(lightness: float, width: int, height: int, radius: Optional[float] = None) -> Arr:
+    """(height, width, 3) gamut pattern for a chroma/hue plane.
+
+    With radius, tiles outside that disc in plane coords are left black.
+    """
+    pattern = np.zeros((height, width, 3))
+    for ty in range(-(-height // tileSize)):
+        for tx in range(-(-width // tileSize)):
+            if radius is not None and not _tileInDisc(tx, ty, width, height, radius):
+                continue
+            tile = _patternTile(lightness, width, height, tx, ty)
+            y0, x0 = ty * tileSize, tx * tileSize
+            pattern[y0:y0+tile.shape[0], x0:x0+tile.shape[1]] = tile
+    return pattern
+
+def clearTileCache() -> None:
+    _tileCache.clear()
+    _planeGeometry.cache_clear()
+    _lightnessRow.cache_clear()
+
+_discRadius = 0.333 / 0.4
+
+@lru_cache(maxsize=8)
+def _planeGeometry(width: int, height: int) -> Tuple[Arr, Arr, Arr, Arr, Arr]:
+    """Plane coords, pixel indices sorted by their radius, and the pixels
+    entirely outside the selector disc."""
+    x, y = _fragCoords(0, 0, width, height, height)
+    s = min(width, height) / 2
+    cx, cy = (x - width / 2) / s, (y - height / 2) / s
+    radius = np.hypot(cx, cy).ravel()
+    order = np.argsort(radius)
+    sortedRadius = radius[order]
+    outside = np.sort(order[np.searchsorted(sortedRadius, _discRadius + 1/s):])
+    for a in (cx, cy, order, sortedRadius, outside):
+        a.flags.writeable = False
+    return cx, cy, order, sortedRadius, outside
+
+def _annulus(order: Arr, sortedRadius: Arr, r1: float, r2: float) -> Tuple[Arr, Arr]:
+    """Flat pixel indices with r1 < radius < r2, and their radii."""
+    lo = np.searchsorted(sortedRadius, r1, 'right')
+    hi = np.searchsorted(sortedRadius, r2, 'left')
+    return order[lo:hi], sortedRadius[lo:hi]
+
+def _mixAt(target: Arr, b, index: Arr, t: Arr) -> None:
+    """_mix into the flat pixels index of target in place."""
+    flat = target.reshape(-1, 3)
+    flat[index] += (np.asarray(b) - flat[index]) * t[:, None]
+
+def _box(pos: Sequence[float], radius: float, s: float, width: int, height: int) -> Tuple[slice, slice]:
+    """Image rows and columns covering a circle in plane coords."""
+    x = pos[0] * s + width / 2
+    y = height - (pos[1] * s + height / 2)
+    r = radius * s + 2
+    return (
+        slice(max(0, int(y - r)), max(0, int(y + r) + 1)),
+        slice(max(0, int(x - r)), max(0, int(x + r) + 1)),
+    )
+
+def chromaHueImage(lab1: Sequence[float], lab2: Sequence[float], width: int, height: int) -> Arr:
+    """ChromaHueSelector with lab1 as the active color."""
+    cx, cy, order, sortedRadius, outside = _planeGeometry(width, height)
+    s = min(width, height) / 2
+
+    color1 = _oklabToSrgb(lab1)
+    color2 = _oklabToSrgb(lab2)
+    coord1 = (lab1[1] / 0.4, lab1[2] / 0.4)
+    coord2 = (lab2[1] / 0.4, lab2[2] / 0.4)
+    outlineColor = _outlineColor(lab1[0])
+
+    # Everything past the selector disc is painted over below.
+    target = gamutPattern(lab1[0], width, height, _discRadius + 1/s)
+    # Rings and the outer border are only nonzero in annuli, found by
+    # searching the pixels sorted by radius.
+    rings = np.zeros(width * height)
+    for r in (float(np.hypot(*coord1)), float(np.hypot(*coord2))):
+        index, radius = _annulus(order, sortedRadius, r, r + 0.0025 + 1/s)
+        rings[index] = np.maximum(rings[index], _outline(radius - r, 0.0025, s))
+    index = np.flatnonzero(rings)
+    _mixAt(target, outlineColor, index, rings[index])
+    target.reshape(-1, 3)[outside] = color1
+    index, radius = _annulus(order, sortedRadius, _discRadius, _discRadius + 1/s)
+    _mixAt(target, color1, index, np.clip((radius - _discRadius) * s, 0, 1))
+    # The handles only cover small boxes, so blend just those.
+    box1 = _box(coord1, 0.1 + 0.0125, s, width, height)
+    box2 = _box(coord2, 0.1 + 0.005, s, width, height)
+    handles = [
+        (box2, color2, lambda x, y: _circle(coord2, x, y, 0.1, s)),
+        (box1, color1, lambda x, y: _circle(coord1, x, y, 0.1, s)),
+        (box2, outlineColor, lambda x, y: _circleOutline(coord2, x, y, 0.1, 0.005, s)),
+        (box1, outlineColor, lambda x, y: _circleOutline(coord1, x, y, 0.1, 0.0125, s)),
+    ]
+    for box, color, weight in handles:
+        target[box] = _mix(target[box], color, weight(cx[box], cy[box]))
+    return _toBytes(target)
+
+@lru_cache(maxsize=64)
+def _lightnessRow(a: float, b: float, width: int) -> Arr:
+    """Gamut part of lab3.frag, which only varies along x."""
+    s = width
+    lightness = (np.arange(width) + 0.5) / s
+    lab = np.stack([lightness, np.full(width, a), np.full(width, b)], axis=-1)
+    srgb, d = _clampedSrgb(lab)
+    lineColor = np.where(lightness < 0.5, 1.0, 0.0)[:, None]
+    row = srgb + (lineColor - srgb) * (_outline(2.5*d, 0.0025, s) * 0.2)[:, None]
+    row.flags.writeable = False
+    return row
+
+def lightnessImage(lab1: Sequence[float], lab2: Sequence[float], width: int, height: int) -> Arr:
+    """LightnessSelector with lab1 as the active color."""
+    x, y = _fragCoords(0, 0, width, height, height)
+    s = width
+    h2 = 0.5 * height / s
+    cx, cy = x / s, y / s
+
+    color1 = _oklabToSrgb(lab1)
+    color2 = _oklabToSrgb(lab2)
+    coord1 = (lab1[0], h2)
+    coord2 = (lab2[0], h2)
+
+    target = np.broadcast_to(_lightnessRow(lab1[1], lab1[2], width), (height, width, 3))
+    target = _mix(target, color2, _circle(coord2, cx, cy, h2*0.5, s))
+    target = _mix(target, color1, _circle(coord1, cx, cy, h2*0.5, s))
+    target = _mix(target, _outlineColor(lab2[0]), _circleOutline(coord2, cx, cy, h2*0.5, h2*0.02, s))
+    target = _mix(target, _outlineColor(lab1[0]), _circleOutline(coord1, cx, cy, h2*0.5, h2*0.08, s))
+    return _toBytes(target)
+
+def toQImage(srgb: Arr):
+    """QImage owning a copy of an (H, W, 3) uint8 array."""
+    from PyQt5.QtGui import QImage # type: ignore
+    h, w, _ = srgb.shape
+    data = np.ascontiguousarray(srgb).tobytes()
+    return QImage(data, w, h, 3 * w, QImage.Format_RGB888).copy()
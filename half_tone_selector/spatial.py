@@ -0,0 +1,244 @@
+"""
+Nearest saved tone lookup.
+
+ToneIndex keeps every tone of app.s.halfTones in a k-d tree over Oklab
+and follows the app's addHalfToneSet and removeHalfToneSet callbacks, so
+it is never rebuilt as a whole on a change. Tones are added to the leaf
+they fall in, leaves split at their median once full, and a subtree is
+rebuilt when one side outgrows the other, which keeps the depth
+logarithmic for any insertion order. Every node keeps the bounding box
+of its tones, and nearest visits nodes closest box first until no box
+can hold anything closer, so dense clusters far from the query are
+skipped whole.
+"""
+import heapq
+from itertools import count
+from math import dist, log2
+from operator import itemgetter
+from typing import (
+    TYPE_CHECKING,
+    List,
+    Optional,
+    Tuple,
+)
+from .matrix import Vec
+from .color import convertColorSpace
+from .state import HalfToneSet
+if TYPE_CHECKING:
+    from .app import HalfToneSelectorApp
+
+# Oklab L, a, b of the tone, its set and its index in the set.
+Entry = Tuple[float, float, float, HalfToneSet, int]
+
+_coords = [itemgetter(0), itemgetter(1), itemgetter(2)]
+
+class _Node:
+    """A leaf holding entries, or a split on axis at value."""
+    __slots__ = ('lo', 'hi', 'size', 'entries', 'axis', 'value', 'left', 'right')
+
+    def __init__(self, entries: List[Entry]) -> None:
+        self.entries: Optional[List[Entry]] = entries
+        self.size = len(entries)
+        self.axis = 0
+        self.value = 0.0
+        self.left: Optional[_Node] = None
+        self.right: Optional[_Node] = None
+        if entries:
+            self.lo = [min(map(c, entries)) for c in _coords]
+            self.hi = [max(map(c, entries)) for c in _coords]
+        else:
+            self.lo = [float('inf')] * 3
+            self.hi = [float('-inf')] * 3
+
+    def boxDistance2(self, lab: Vec) -> float:
+        """Squared distance from lab to the bounding box."""
+        d = 0.0
+        for x, lo, hi in zip(lab, self.lo, self.hi):
+            if x < lo:
+                d += (lo - x) ** 2
+            elif x > hi:
+                d += (x - hi) ** 2
+        return d
+
+def _spread(entries: List[Entry], axis: int) -> float:
+    values = list(map(_coords[axis], entries))
+    return max(values) - min(values)
+
+def _build(entries: List[Entry], leafSize: int) -> _Node:
+    """A balanced subtree of entries, split at the median of the widest axis."""
+    if len(entries) <= leafSize:
+        return _Node(entries)
+    # The widest axis of a sample, which is enough to pick a good split.
+    sample = entries[::len(entries) // 32 + 1]
+    axis = max(range(3), key=lambda a: _spread(sample, a))
+    if not _spread(sample, axis):
+        axis = max(range(3), key=lambda a: _spread(entries, a))
+        if not _spread(entries, axis):
+            # Every tone is at the same point.
+            return _Node(entries)
+    entries = sorted(entries, key=_coords[axis])
+    # Equal values go right, so split at the first of a run of them,
+    # moving up past the middle when the run starts at the front.
+    mid = len(entries) // 2
+    value = entries[mid][axis]
+    while entries[mid - 1][axis] == value:
+        mid -= 1
+        if not mid:
+            while entries[mid][axis] == value:
+                mid += 1
+            value = entries[mid][axis]
+            break
+    node = _Node([])
+    node.entries = None
+    node.size = len(entries)
+    node.axis = axis
+    node.value = value
+    node.left = left = _build(entries[:mid], leafSize)
+    node.right = right = _build(entries[mid:], leafSize)
+    node.lo = [min(a, b) for a, b in zip(left.lo, right.lo)]
+    node.hi = [max(a, b) for a, b in zip(left.hi, right.hi)]
+    return node
+
+def _collect(node: _Node, out: List[Entry]) -> List[Entry]:
+    stack = [node]
+    while stack:
+        n = stack.pop()
+        if n.entries is not None:
+            out.extend(n.entries)
+        else:
+            stack.append(n.left) # type: ignore
+            stack.append(n.right) # type: ignore
+    return out
+
+class ToneIndex:
+    def __init__(self, leafSize: int = 8) -> None:
+        self.leafSize = leafSize
+        self._root = _Node([])
+        # Mirrors app.s.halfTones, since sets are already gone when
+        # removeHalfToneSet callbacks run.
+        self._sets: List[HalfToneSet] = []
+        # Removals since the last full rebuild. Boxes only grow, so they
+        # are tightened again once this passes the size.
+        self._removed = 0
+
+    def __len__(self) -> int:
+        return self._root.size
+
+    def attach(self, app: 'HalfToneSelectorApp') -> None:
+        """Index app.s.halfTones and follow changes to it."""
+        self._sets = list(app.s.halfTones)
+        self._rebuild()
+        app.registerCallback(['addHalfToneSet'], lambda i, n: self.insertMany(i, app.s.halfTones[i:i + n]))
+        app.registerCallback(['removeHalfToneSet'], self.remove)
+
+    def _entries(self, hts: HalfToneSet) -> List[Entry]:
+        entries = []
+        for j, lch in enumerate(hts.tones):
+            l, a, b = convertColorSpace(lch, 'Oklch', 'Oklab')
+            entries.append((l, a, b, hts, j))
+        return entries
+
+    def _rebuild(self) -> None:
+        entries = [e for hts in self._sets for e in self._entries(hts)]
+        self._root = _build(entries, self.leafSize)
+        self._removed = 0
+
+    def insert(self, i: int, hts: HalfToneSet) -> None:
+        self.insertMany(i, [hts])
+
+    def insertMany(self, i: int, sets: List[HalfToneSet]) -> None:
+        """Insert sets at i, rebuilding the tree once they outnumber it."""
+        self._sets[i:i] = sets
+        entries = [e for hts in sets for e in self._entries(hts)]
+        if len(entries) > len(self):
+            self._rebuild()
+            return
+        for entry in entries:
+            self._insertEntry(entry)
+
+    def _insertEntry(self, entry: Entry) -> None:
+        path = []
+        node = self._root
+        while True:
+            path.append(node)
+            node.size += 1
+            lo, hi = node.lo, node.hi
+            for axis in range(3):
+                x = entry[axis]
+                if x < lo[axis]:
+                    lo[axis] = x
+                if x > hi[axis]:
+                    hi[axis] = x
+            if node.entries is not None:
+                node.entries.append(entry)
+                break
+            node = node.left if entry[node.axis] < node.value else node.right # type: ignore
+        # Split a full leaf, unless all of its tones are the same color.
+        if len(node.entries) > self.leafSize and node.lo != node.hi:
+            self._replace(path, len(path) - 1)
+        # Rebuild the highest lopsided subtree once the path gets too deep.
+        if len(path) > 2 * log2(self._root.size / self.leafSize + 1) + 2:
+            for depth, node in enumerate(path[:-1]):
+                if max(node.left.size, node.right.size) > 0.7 * node.size: # type: ignore
+                    self._replace(path, depth)
+                    break
+
+    def _replace(self, path: List[_Node], depth: int) -> None:
+        node = _build(_collect(path[depth], []), self.leafSize)
+        if depth == 0:
+            self._root = node
+            return
+        parent = path[depth - 1]
+        if parent.left is path[depth]:
+            parent.left = node
+        else:
+            parent.right = node
+
+    def remove(self, i: int) -> None:
+        hts = self._sets.pop(i)
+        for entry in self._entries(hts):
+            path = [self._root]
+            while path[-1].entries is None:
+                node = path[-1]
+                path.append(node.left if entry[node.axis] < node.value else node.right) # type: ignore
+            leaf = path[-1]
+            entries = [e for e in leaf.entries if e[3] is not hts] # type: ignore
+            removed = leaf.size - len(entries)
+            leaf.entries = entries
+            for node in path:
+                node.size -= removed
+            self._removed += removed
+        if self._removed > self._root.size:
+            self._rebuild()
+
+    def nearest(self, lab: Vec, k: int = 1) -> List[Tuple[float, HalfToneSet, int]]:
+        """The k closest tones to lab as (distance, set, tone index),
+        closest first."""
+        if not len(self):
+            return []
+        x, y, z = lab
+        # Max heap of the best k by negated squared distance.
+        best: List[Tuple[float, int, Entry]] = []
+        tiebreak = count()
+        # Min heap of nodes by squared distance to their box.
+        nodes = [(self._root.boxDistance2(lab), next(tiebreak), self._root)]
+        while nodes:
+            d2, _, node = heapq.heappop(nodes)
+            if len(best) == k and d2 > -best[0][0]:
+                break
+            if node.entries is None:
+                for child in (node.left, node.right):
+                    if child.size: # type: ignore
+                        heapq.heappush(nodes, (child.boxDistance2(lab), next(tiebreak), child)) # type: ignore
+                continue
+            for entry in node.entries:
+                dl = x - entry[0]
+                da = y - entry[1]
+                db = z - entry[2]
+                d2 = dl*dl + da*da + db*db
+                if len(best) < k:
+                    heapq.heappush(best, (-d2, next(tiebreak), entry))
+                elif d2 < -best[0][0]:
+                    heapq.heapreplace(best, (-d2, next(tiebreak), entry))
+        found = [(dist(lab, entry[:3]), i, entry) for _, i, entry in best]
+        return [(d, entry[3], entry[4]) for d, _, entry in sorted(found)]
@@ -0,0 +1,69 @@
+"""
+Startup timing for the docker.
+
+Set HALF_TONE_SELECTOR_STARTUP_TIMING=1 to print the report once the
+docker has been built and every expected phase has run, e.g. the
+initializeGL of both selectors, which only happens after the first show.
+Phases that run again later, like initializeGL when the docker is
+undocked, are reported separately.
+"""
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+# Seconds spent in each startup phase, accumulated across calls.
+startupTimes: Dict[str, float] = {}
+# Seconds and runs of phases after the startup report.
+laterTimes: Dict[str, float] = {}
+laterCounts: Dict[str, int] = {}
+# Runs of each phase still expected before startup is complete.
+_pending: Dict[str, int] = {}
+_built = False
+_reported = False
+
+def expectPhase(name: str, count: int = 1) -> None:
+    """Hold the report until name has run count more times."""
+    if not _reported:
+        _pending[name] = _pending.get(name, 0) + count
+
+@contextmanager
+def startupPhase(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if _reported:
+            laterTimes[name] = laterTimes.get(name, 0.0) + elapsed
+            laterCounts[name] = laterCounts.get(name, 0) + 1
+        else:
+            startupTimes[name] = startupTimes.get(name, 0.0) + elapsed
+            if _pending.get(name):
+                _pending[name] -= 1
+            _maybeFinish()
+
+def finishBuild() -> None:
+    """Mark the docker as built. Reports once nothing is pending."""
+    global _built
+    _built = True
+    _maybeFinish()
+
+def _maybeFinish() -> None:
+    global _reported
+    if _built and not _reported and not any(_pending.values()):
+        _reported = True
+        printStartupReport()
+
+def startupReport() -> str:
+    report = ', '.join(f'{name}={t*1000:.1f}ms' for name, t in startupTimes.items())
+    if laterTimes:
+        later = ', '.join(
+            f'{name}={t*1000:.1f}ms/{laterCounts[name]}'
+            for name, t in laterTimes.items())
+        report += f' (later: {later})'
+    return report
+
+def printStartupReport() -> None:
+    if os.environ.get('HALF_TONE_SELECTOR_STARTUP_TIMING'):
+        print(f'Half Tone Selector startup: {startupReport()}')
@@ -1,23 +1,130 @@
 import json
+from array import array
 from dataclasses import dataclass, field, fields
+from functools import lru_cache
 from math import cos, pi
 from pathlib import Path
-from typing import List
+from typing import (
+    Iterable,
+    Iterator,
+    List,
+    Sequence,
+    Tuple,
+)
 from .matrix import (
     Vec,
 )
 from .color import (
-    interpolateOklch,
+    interpolateOklchFunc,
     convertColorSpace
 )
+from .instrument import instrumented
+
+class Tones:
+    """Oklch tones packed into a flat array('d'), three floats per tone.
+
+    Indexing and iteration give [l, c, h] lists, so it reads like a
+    List[Vec]. The lists are copies; assign through tones[i] = lch to
+    change a tone. asArray() is a zero-copy (n, 3) NumPy view for the
+    batch path. While such a view is alive, append raises BufferError,
+    since the array cannot be resized under it.
+    """
+    __slots__ = ('data',)
+
+    def __init__(self, tones: Iterable[Sequence[float]] = ()) -> None:
+        if isinstance(tones, Tones):
+            self.data = array('d', tones.data)
+            return
+        # Unpacking checks that every tone has three values.
+        self.data = array('d', [x for l, c, h in tones for x in (l, c, h)])
+
+    @staticmethod
+    def fromBuffer(data: array) -> 'Tones':
+        """Wrap a flat array('d') without copying."""
+        if len(data) % 3:
+            raise ValueError('Expected three floats per tone.')
+        tones = Tones()
+        tones.data = data
+        return tones
+
+    def append(self, tone: Sequence[float]) -> None:
+        if len(tone) != 3:
+            raise ValueError(f'Expected an Oklch tone, got {tone!r}')
+        self.data.extend(tone)
+
+    def __len__(self) -> int:
+        return len(self.data) // 3
+
+    def _index(self, i: int) -> int:
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError('Tone index out of range')
+        return 3 * i
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        j = self._index(i)
+        return self.data[j:j+3].tolist()
+
+    def __setitem__(self, i: int, tone: Sequence[float]) -> None:
+        if len(tone) != 3:
+            raise ValueError(f'Expected an Oklch tone, got {tone!r}')
+        j = self._index(i)
+        self.data[j:j+3] = array('d', tone)
+
+    def __iter__(self) -> Iterator[Vec]:
+        data = self.data
+        for j in range(0, len(data), 3):
+            yield data[j:j+3].tolist()
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, Tones):
+            return self.data == other.data
+        if isinstance(other, list):
+            return self.tolist() == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f'Tones({self.tolist()!r})'
+
+    def tolist(self) -> List[Vec]:
+        return list(self)
+
+    def astuple(self) -> Tuple[float, ...]:
+        """Flat l, c, h values as a tuple, e.g. as a cache key."""
+        return tuple(self.data)
+
+    def asArray(self):
+        """(n, 3) float64 view of the data. Requires NumPy.
+
+        The array shares memory with the tones. Tones.append raises
+        BufferError until the view is released, so copy it to keep it.
+        """
+        import numpy as np
+        return np.frombuffer(self.data, dtype=np.float64).reshape(-1, 3)
+
+    def __array__(self, dtype=None, copy=None):
+        a = self.asArray()
+        if dtype is not None and a.dtype != dtype:
+            if copy is False:
+                raise ValueError(f'Casting tones to {dtype} requires a copy.')
+            return a.astype(dtype)
+        return a.copy() if copy else a
 
 @dataclass
 class HalfToneSet:
     name: str
-    tones: List[Vec]
+    tones: Tones
+
+    def __post_init__(self) -> None:
+        if not isinstance(self.tones, Tones):
+            self.tones = Tones(self.tones)
 
     def to_dict(self) -> dict:
-        return {f.name: getattr(self, f.name) for f in fields(HalfToneSet)}
+        return {'name': self.name, 'tones': self.tones.tolist()}
 
     @staticmethod
     def _old_from_dict(d: List[str]) -> 'HalfToneSet':
@@ -78,28 +185,49 @@ class AppState:
     count: int = 5
     # Non-linear selection of half tones.
     cos: bool = True
+    # How out of gamut tones are displayed and exported, see gamut.gamutMappings.
+    gamutMapping: str = 'clip'
     # Half tones.
     halfTones: List[HalfToneSet] = field(default_factory=list)
     # Settings visibility metadata
     visibleMeta: VisibleMeta = field(default_factory=VisibleMeta)
 
-    def to_dict(self) -> dict:
-        def serialize(name: str):
-            if name == 'halfTones':
-                return [hts.to_dict() for hts in self.halfTones]
-            elif name == 'visibleMeta':
-                return self.visibleMeta.to_dict()
+    def serializeField(self, name: str):
+        if name == 'halfTones':
+            return [hts.to_dict() for hts in self.halfTones]
+        elif name == 'visibleMeta':
+            return self.visibleMeta.to_dict()
+        else:
+            return getattr(self, name)
+
+    def deserializeField(self, name: str, value) -> None:
+        if name == 'halfTones':
+            halfToneSets = [HalfToneSet.from_dict(hts) for hts in value]
+            setattr(self, name, halfToneSets)
+        elif name == 'visibleMeta':
+            setattr(self, name, VisibleMeta.from_dict(value))
+        elif name in ('light', 'dark', 'emitter'):
+            if isinstance(value, str):
+                # Backwards compatibility.
+                lch = convertColorSpace(value, 'StringRGB', 'Oklch')
+                setattr(self, name, lch)
             else:
-                return getattr(self, name)
+                setattr(self, name, value)
+        else:
+            setattr(self, name, value)
+
+    def to_dict(self) -> dict:
         return {
-            f.name: serialize(f.name)
+            f.name: self.serializeField(f.name)
             for f in fields(AppState)
             if f.name not in ['emitter', 'normalize', 'intensity', 'white']
         }
 
     def to_file(self, path: Path) -> None:
+        # One dumps call is much faster than json.dump's chunked writes.
+        text = json.dumps(self.to_dict())
         with path.open('w') as f:
-            json.dump(self.to_dict(), f)
+            f.write(text)
 
     @staticmethod
     def from_dict(d: dict) -> 'AppState':
@@ -109,20 +237,7 @@ class AppState:
                 # Ignore emitter settings.
                 continue
             if f.name in d:
-                if f.name == 'halfTones':
-                    halfToneSets = [HalfToneSet.from_dict(hts) for hts in d[f.name]]
-                    setattr(s, f.name, halfToneSets)
-                elif f.name == 'visibleMeta':
-                    setattr(s, f.name, VisibleMeta.from_dict(d[f.name]))
-                elif f.name in ('light', 'dark', 'emitter'):
-                    if isinstance(d[f.name], str):
-                        # Backwards compatibility.
-                        lch = convertColorSpace(d[f.name], 'StringRGB', 'Oklch')
-                        setattr(s, f.name, lch)
-                    else:
-                        setattr(s, f.name, d[f.name])
-                else:
-                    setattr(s, f.name, d[f.name])
+                s.deserializeField(f.name, d[f.name])
         return s
 
     @staticmethod
@@ -139,9 +254,17 @@ def computeIntervals(n: int, useCos: bool) -> List[float]:
     else:
         return list(reversed(intervals))
 
-def generateColors(s: AppState) -> HalfToneSet:
-    ts = computeIntervals(s.count, s.cos)
-    lchs = [interpolateOklch(s.dark, s.light, t, s.k) for t in ts]
+@lru_cache(maxsize=256)
+def _generateTones(
+        light: Tuple[float, ...],
+        dark: Tuple[float, ...],
+        k: float,
+        count: int,
+        useCos: bool,
+        ) -> Tuple[float, ...]:
+    ts = computeIntervals(count, useCos)
+    interpolate = interpolateOklchFunc(dark, light)
+    lchs = [interpolate(t, k) for t in ts]
     # linears = [oklchToLinearRgb(lch) for lch in lchs]
 
     # emitterLch = list(s.emitter)
@@ -156,4 +279,21 @@ def generateColors(s: AppState) -> HalfToneSet:
     #     for e, rgb in zip(emitterIntervals, linears)]
 
     # tones = [linearRgbToOklch(rgb) for rgb in finalLinears]
-    return HalfToneSet(name='', tones=lchs)
+    return tuple(x for lch in lchs for x in lch)
+
+@instrumented('generateColors')
+def generateColors(s: AppState) -> HalfToneSet:
+    """Half tones for the current parameters.
+
+    Results are memoized on (light, dark, k, count, cos). Each call gets its
+    own HalfToneSet, so callers are free to rename or store it.
+    """
+    tones = _generateTones(tuple(s.light), tuple(s.dark), s.k, s.count, s.cos)
+    return HalfToneSet(name='', tones=Tones.fromBuffer(array('d', tones)))
+
+def generateColorsCacheInfo():
+    """Hits, misses, maxsize and currsize of the generateColors cache."""
+    return _generateTones.cache_info()
+
+def clearGenerateColorsCache() -> None:
+    _generateTones.cache_clear()
@@ -1,10 +1,12 @@
 import math
+import os
 from ctypes import c_uint
-from PyQt5.QtCore import Qt, QTimer # type: ignore
+from PyQt5.QtCore import Qt # type: ignore
 from PyQt5.QtGui import ( # type: ignore
     QOpenGLFramebufferObject,
     QOpenGLVertexArrayObject,
     QColor,
+    QPainter,
 )
 from PyQt5.QtWidgets import ( # type: ignore
     QOpenGLWidget,
@@ -15,10 +17,10 @@ from PyQt5.QtWidgets import ( # type: ignore
     QSizePolicy,
 )
 from .gl import (
+    glAvailable,
     loadGLFuncs,
-    loadShader,
+    loadProgram,
     shadersDir,
-    createProgram,
 )
 from .color import (
     convertColorSpace,
@@ -27,10 +29,18 @@ from .color import (
 from .app import (
     HalfToneSelectorApp,
 )
+from .startup import (
+    expectPhase,
+    startupPhase,
+)
+from .instrument import (
+    byClass,
+    instrumented,
+)
 
-class ChromaHueSelector(QOpenGLWidget):
-    def __init__(self, app: HalfToneSelectorApp) -> None:
-        super().__init__()
+class ChromaHueInput:
+    """Chroma/hue selector state and mouse input, shared by both renderers."""
+    def _initSelector(self, app: HalfToneSelectorApp) -> None:
         self._app = app
         self._width = 800
         self._height = 600
@@ -44,12 +54,14 @@ class ChromaHueSelector(QOpenGLWidget):
             self._activeColor = 1
             self.colorError = getColorError(self._color1)
             self._changeCallback()
+            self.update()
 
         def updateColor2():
             self._color2 = convertColorSpace(app.s.dark, 'Oklch', 'Oklab')
             self._activeColor = 2
             self.colorError = getColorError(self._color2)
             self._changeCallback()
+            self.update()
 
         app.registerCallback(['dark'], updateColor2)
         app.registerCallback(['light'], updateColor1)
@@ -59,26 +71,87 @@ class ChromaHueSelector(QOpenGLWidget):
     def setChangeCallback(self, func):
         self._changeCallback = func
 
+    def activeLabs(self):
+        """Oklab of the active color, then the other one."""
+        if self._activeColor == 1:
+            return self._color1, self._color2
+        else: # self._activeColor == 2
+            return self._color2, self._color1
+
+    def _resize(self, width, height):
+        self._dpr = self.devicePixelRatioF()
+        self._width = round(width * self._dpr)
+        self._height = round(height * self._dpr)
+
+    def handleColorChange(self, coord):
+        if self._activeColor == 1:
+            lightness = self._color1[0]
+        else: # self._activeColor == 2
+            lightness = self._color2[0]
+        color = [lightness, coord[0], coord[1]]
+        lch = convertColorSpace(color, 'Oklab', 'Oklch')
+        if self._activeColor == 1:
+            self._app.setState(light=lch)
+        else: # self._activeColor == 2
+            self._app.setState(dark=lch)
+
+    def getCoord(self, x, y):
+        """Coord from pixel xy."""
+        w2, h2 = self._width / 2, self._height / 2
+        s = min(w2, h2)
+        coord = (0.4*(x*self._dpr-w2)/s, 0.4*(h2-y*self._dpr)/s)
+        length = math.hypot(*coord)
+        if length > 0.333:
+            coord = (coord[0] / length * 0.333, coord[1] / length * 0.333)
+        return coord
+
+    def mouseMoveEvent(self, event):
+        p = event.pos()
+        coord = self.getCoord(p.x(), p.y())
+        if self._isMousePressed:
+            self.handleColorChange(coord)
+
+    def mousePressEvent(self, event):
+        self._isMousePressed = True
+        p = event.pos()
+        coord = self.getCoord(p.x(), p.y())
+        d1 = math.dist(coord, self._color1[1:3])
+        d2 = math.dist(coord, self._color2[1:3])
+        if d1 < 0.1 or d2 < 0.1:
+            self._activeColor = 1 if d1 < d2 else 2
+        self.handleColorChange(coord)
+
+    def mouseReleaseEvent(self, event):
+        self._isMousePressed = False
+
+    def leaveEvent(self, event):
+        self._isMousePressed = False
+
+class ChromaHueSelector(ChromaHueInput, QOpenGLWidget):
+    def __init__(self, app: HalfToneSelectorApp) -> None:
+        super().__init__()
+        # (lightness, width, height) the pattern FBO was last drawn with.
+        self._patternKey = None
+        self._initSelector(app)
+
     def initializeGL(self):
+        with startupPhase('initializeGL'):
+            self._initializeGL()
+
+    def _initializeGL(self):
         self.setMouseTracking(True)
         # self.setAttribute(Qt.WA_AlwaysStackOnTop)
         loadGLFuncs(self, self.context())
 
-        vert1 = loadShader(self.context(), shadersDir / 'lab1.vert')
-        frag1 = loadShader(self.context(), shadersDir / 'lab1.frag')
-        frag2 = loadShader(self.context(), shadersDir / 'lab2.frag')
-        self._prog_1 = createProgram(vert1, frag1)
-        self._prog_2 = createProgram(vert1, frag2)
+        context = self.context()
+        self._prog_1 = loadProgram(context, shadersDir / 'lab1.vert', shadersDir / 'lab1.frag')
+        self._prog_2 = loadProgram(context, shadersDir / 'lab1.vert', shadersDir / 'lab2.frag')
         self._init_fbo()
 
         self._vao = QOpenGLVertexArrayObject()
         self._vao.create()
         self._vao.bind()
 
-        self._timer = QTimer(self)
-        self._timer.timeout.connect(self.update)
-        self._timer.start(int(1000.0 / 60.0)) # 60 FPS
-
     def _init_fbo(self):
         w, h = self._width, self._height
         fbo = QOpenGLFramebufferObject(w, h, self.COLOR_ATTACHMENT0, self.TEXTURE_2D)
@@ -88,15 +161,18 @@ class ChromaHueSelector(QOpenGLWidget):
         # self.glReadBuffer(self.COLOR_ATTACHMENT1)
         fbo.release()
         self._fbo = fbo
+        self._patternKey = None
 
     def _draw_1(self):
+        """Gamut pattern for the active lightness, skipped if unchanged."""
         w, h = self._width, self._height
+        lightness = self.activeLabs()[0][0]
+        key = (lightness, w, h)
+        if key == self._patternKey:
+            return
         self._prog_1.bind()
         self._prog_1.setUniformValue('u_resolution', w, h)
-        if self._activeColor == 1:
-            self._prog_1.setUniformValue('u_lightness', self._color1[0])
-        else: # self._activeColor == 2
-            self._prog_1.setUniformValue('u_lightness', self._color2[0])
+        self._prog_1.setUniformValue('u_lightness', lightness)
 
         self._fbo.bind()
         self._vao.bind()
@@ -104,16 +180,14 @@ class ChromaHueSelector(QOpenGLWidget):
         self.glClear(self.COLOR_BUFFER_BIT | self.DEPTH_BUFFER_BIT)
         self.glDrawArrays(self.GL_TRIANGLE_STRIP, 0, 4)
         self._fbo.release()
+        self._patternKey = key
 
     def _draw_2(self):
         self._prog_2.bind()
         self._prog_2.setUniformValue('u_resolution', self._width, self._height)
-        if self._activeColor == 1:
-            self._prog_2.setUniformValue('lab_1', *self._color1)
-            self._prog_2.setUniformValue('lab_2', *self._color2)
-        else: # self._activeColor == 2
-            self._prog_2.setUniformValue('lab_2', *self._color1)
-            self._prog_2.setUniformValue('lab_1', *self._color2)
+        lab1, lab2 = self.activeLabs()
+        self._prog_2.setUniformValue('lab_1', *lab1)
+        self._prog_2.setUniformValue('lab_2', *lab2)
         self._prog_2.setUniformValue('pattern', 0)
         self._prog_2.setUniformValue('e', 1)
 
@@ -129,66 +203,37 @@ class ChromaHueSelector(QOpenGLWidget):
         self.glClear(self.COLOR_BUFFER_BIT | self.DEPTH_BUFFER_BIT)
         self.glDrawArrays(self.GL_TRIANGLE_STRIP, 0, 4)
 
+    @instrumented('paintGL', byClass)
     def paintGL(self):
         self._draw_1()
         self._draw_2()
 
     def resizeGL(self, width, height):
-        self._dpr = self.devicePixelRatioF()
-        w = round(width * self._dpr)
-        h = round(height * self._dpr)
-        self._width = w
-        self._height = h
-        self.glViewport(0, 0, w, h)
+        self._resize(width, height)
+        self.glViewport(0, 0, self._width, self._height)
         self._init_fbo()
 
-    def handleColorChange(self, coord):
-        if self._activeColor == 1:
-            lightness = self._color1[0]
-        else: # self._activeColor == 2
-            lightness = self._color2[0]
-        color = [lightness, coord[0], coord[1]]
-        lch = convertColorSpace(color, 'Oklab', 'Oklch')
-        if self._activeColor == 1:
-            self._app.setState(light=lch)
-        else: # self._activeColor == 2
-            self._app.setState(dark=lch)
-
-    def getCoord(self, x, y):
-        """Coord from pixel xy."""
-        w2, h2 = self._width / 2, self._height / 2
-        s = min(w2, h2)
-        coord = (0.4*(x*self._dpr-w2)/s, 0.4*(h2-y*self._dpr)/s)
-        length = math.hypot(*coord)
-        if length > 0.333:
-            coord = (coord[0] / length * 0.333, coord[1] / length * 0.333)
-        return coord
-
-    def mouseMoveEvent(self, event):
-        p = event.pos()
-        coord = self.getCoord(p.x(), p.y())
-        if self._isMousePressed:
-            self.handleColorChange(coord)
-
-    def mousePressEvent(self, event):
-        self._isMousePressed = True
-        p = event.pos()
-        coord = self.getCoord(p.x(), p.y())
-        d1 = math.dist(coord, self._color1[1:3])
-        d2 = math.dist(coord, self._color2[1:3])
-        if d1 < 0.1 or d2 < 0.1:
-            self._activeColor = 1 if d1 < d2 else 2
-        self.handleColorChange(coord)
-
-    def mouseReleaseEvent(self, event):
-        self._isMousePressed = False
-
-    def leaveEvent(self, event):
-        self._isMousePressed = False
-
-class LightnessSelector(QOpenGLWidget):
-    def __init__(self, app: HalfToneSelectorApp):
+class SoftwareChromaHueSelector(ChromaHueInput, QWidget):
+    """ChromaHueSelector drawn on the CPU by render.py."""
+    def __init__(self, app: HalfToneSelectorApp) -> None:
         super().__init__()
+        self._initSelector(app)
+
+    def resizeEvent(self, event):
+        self._resize(event.size().width(), event.size().height())
+
+    @instrumented('paintEvent', byClass)
+    def paintEvent(self, event):
+        from .render import chromaHueImage, toQImage
+        image = toQImage(chromaHueImage(*self.activeLabs(), self._width, self._height))
+        image.setDevicePixelRatio(self._dpr)
+        painter = QPainter(self)
+        painter.drawImage(0, 0, image)
+        painter.end()
+
+class LightnessInput:
+    """Lightness selector state and mouse input, shared by both renderers."""
+    def _initSelector(self, app: HalfToneSelectorApp) -> None:
         self._app = app
         self._width = 800
         self._height = 600
@@ -199,53 +244,29 @@ class LightnessSelector(QOpenGLWidget):
         def updateColor1():
             self._color1 = convertColorSpace(app.s.light, 'Oklch', 'Oklab')
             self._activeColor = 1
+            self.update()
 
         def updateColor2():
             self._color2 = convertColorSpace(app.s.dark, 'Oklch', 'Oklab')
             self._activeColor = 2
+            self.update()
 
         app.registerCallback(['dark'], updateColor2)
         app.registerCallback(['light'], updateColor1)
         updateColor2()
         updateColor1()
 
-    def initializeGL(self):
-        loadGLFuncs(self, self.context())
-
-        vert = loadShader(self.context(), shadersDir / 'lab1.vert')
-        frag = loadShader(self.context(), shadersDir / 'lab3.frag')
-        self._prog = createProgram(vert, frag)
-
-        self._vao = QOpenGLVertexArrayObject()
-        self._vao.create()
-        self._vao.bind()
-
-        self._timer = QTimer(self)
-        self._timer.timeout.connect(self.update)
-        self._timer.start(int(1000.0 / 60.0)) # 60 FPS
-
-    def paintGL(self):
-        self._prog.bind()
-        self._prog.setUniformValue('u_resolution', self._width, self._height)
+    def activeLabs(self):
+        """Oklab of the active color, then the other one."""
         if self._activeColor == 1:
-            self._prog.setUniformValue('lab_1', *self._color1)
-            self._prog.setUniformValue('lab_2', *self._color2)
+            return self._color1, self._color2
         else: # self._activeColor == 2
-            self._prog.setUniformValue('lab_1', *self._color2)
-            self._prog.setUniformValue('lab_2', *self._color1)
-
-        self._vao.bind()
-        self.glClearColor(0.0, 0.0, 0.0, 0.0)
-        self.glClear(self.COLOR_BUFFER_BIT | self.DEPTH_BUFFER_BIT)
-        self.glDrawArrays(self.GL_TRIANGLE_STRIP, 0, 4)
+            return self._color2, self._color1
 
-    def resizeGL(self, width, height):
+    def _resize(self, width, height):
         self._dpr = self.devicePixelRatioF()
-        w = round(width * self._dpr)
-        h = round(height * self._dpr)
-        self._width = w
-        self._height = h
-        self.glViewport(0, 0, w, h)
+        self._width = round(width * self._dpr)
+        self._height = round(height * self._dpr)
 
     def handleColorChange(self, coord):
         if self._activeColor == 1:
@@ -281,16 +302,87 @@ class LightnessSelector(QOpenGLWidget):
     def leaveEvent(self, event):
         self._isMousePressed = False
 
+class LightnessSelector(LightnessInput, QOpenGLWidget):
+    def __init__(self, app: HalfToneSelectorApp):
+        super().__init__()
+        self._initSelector(app)
+
+    def initializeGL(self):
+        with startupPhase('initializeGL'):
+            self._initializeGL()
+
+    def _initializeGL(self):
+        loadGLFuncs(self, self.context())
+
+        self._prog = loadProgram(self.context(), shadersDir / 'lab1.vert', shadersDir / 'lab3.frag')
+
+        self._vao = QOpenGLVertexArrayObject()
+        self._vao.create()
+        self._vao.bind()
+
+    @instrumented('paintGL', byClass)
+    def paintGL(self):
+        self._prog.bind()
+        self._prog.setUniformValue('u_resolution', self._width, self._height)
+        lab1, lab2 = self.activeLabs()
+        self._prog.setUniformValue('lab_1', *lab1)
+        self._prog.setUniformValue('lab_2', *lab2)
+
+        self._vao.bind()
+        self.glClearColor(0.0, 0.0, 0.0, 0.0)
+        self.glClear(self.COLOR_BUFFER_BIT | self.DEPTH_BUFFER_BIT)
+        self.glDrawArrays(self.GL_TRIANGLE_STRIP, 0, 4)
+
+    def resizeGL(self, width, height):
+        self._resize(width, height)
+        self.glViewport(0, 0, self._width, self._height)
+
+class SoftwareLightnessSelector(LightnessInput, QWidget):
+    """LightnessSelector drawn on the CPU by render.py."""
+    def __init__(self, app: HalfToneSelectorApp):
+        super().__init__()
+        self._initSelector(app)
+
+    def resizeEvent(self, event):
+        self._resize(event.size().width(), event.size().height())
+
+    @instrumented('paintEvent', byClass)
+    def paintEvent(self, event):
+        from .render import lightnessImage, toQImage
+        image = toQImage(lightnessImage(*self.activeLabs(), self._width, self._height))
+        image.setDevicePixelRatio(self._dpr)
+        painter = QPainter(self)
+        painter.drawImage(0, 0, image)
+        painter.end()
+
+def useSoftwareRenderer() -> bool:
+    """Draw the selectors with render.py instead of OpenGL.
+
+    Needs NumPy. With it, forced by HALF_TONE_SELECTOR_SOFTWARE_RENDER=1
+    and otherwise used when OpenGL is unavailable.
+    """
+    try:
+        import numpy # type: ignore
+    except ModuleNotFoundError:
+        return False
+    if os.environ.get('HALF_TONE_SELECTOR_SOFTWARE_RENDER') == '1':
+        return True
+    return not glAvailable()
+
 def toneSettings(app: HalfToneSelectorApp):
     widget = QWidget()
     layout = QVBoxLayout()
     # layout.setAlignment(Qt.AlignTop)
     widget.setLayout(layout)
 
-    chs = ChromaHueSelector(app)
+    if useSoftwareRenderer():
+        chs = SoftwareChromaHueSelector(app)
+        ls = SoftwareLightnessSelector(app)
+    else:
+        chs = ChromaHueSelector(app)
+        ls = LightnessSelector(app)
+        expectPhase('initializeGL', 2)
     layout.addWidget(chs, 11)
-
-    ls = LightnessSelector(app)
     layout.addWidget(ls, 1)
 
     label = QLabel(f'\u0394E={chs.colorError:.3f}')
@@ -0,0 +1,175 @@
+"""
+Painted tone patches.
+
+ToneStrip draws a row of tones in one paintEvent and ColorButton is a
+push button filled with one color, so color changes are a repaint rather
+than a new stylesheet for Qt to parse and polish.
+"""
+from functools import lru_cache
+from typing import (
+    Callable,
+    List,
+    Tuple,
+)
+from PyQt5.QtCore import ( # type: ignore
+    Qt,
+    QEvent,
+    QPoint,
+    QRect,
+    QSize,
+)
+from PyQt5.QtGui import ( # type: ignore
+    QColor,
+    QPainter,
+)
+from PyQt5.QtWidgets import ( # type: ignore
+    QPushButton,
+    QSizePolicy,
+    QToolTip,
+    QWidget,
+)
+from .app import HalfToneSelectorApp
+from .state import Tones
+from .ki import (
+    oklchToQColor,
+    scaleColor,
+    setFGColor,
+)
+
+patchHeight = 18
+
+@lru_cache(maxsize=4096)
+def toneColors(tones: Tuple[float, ...], gamutMapping: str) -> List[QColor]:
+    """QColors of flat Oklch tones, cached since tones repaint often."""
+    return [oklchToQColor(tones[i:i+3], gamutMapping) for i in range(0, len(tones), 3)]
+
+def patchRects(rect: QRect, n: int, margin: int = 1, spacing: int = 1) -> List[QRect]:
+    """Split rect into n patches side by side."""
+    inner = rect.adjusted(margin, margin, -margin, -margin)
+    width = inner.width() - spacing * (n - 1)
+    rects = []
+    for i in range(n):
+        x0 = inner.left() + i * width // n + i * spacing
+        x1 = inner.left() + (i + 1) * width // n + i * spacing
+        rects.append(QRect(x0, inner.top(), x1 - x0, inner.height()))
+    return rects
+
+def paintTones(
+        painter: QPainter,
+        rect: QRect,
+        colors: List[QColor],
+        background: QColor,
+        hovered: int = -1,
+        ) -> None:
+    painter.fillRect(rect, background)
+    rects = patchRects(rect, len(colors))
+    for r, color in zip(rects, colors):
+        painter.fillRect(r, color)
+    if 0 <= hovered < len(rects):
+        painter.setPen(background)
+        painter.drawRect(rects[hovered].adjusted(0, 0, -1, -1))
+
+class ToneStrip(QWidget):
+    """Row of clickable tone patches.
+
+    setTones stores the tones and schedules a single repaint. Clicking a
+    patch passes its color to onClick.
+    """
+    def __init__(
+            self,
+            app: HalfToneSelectorApp,
+            onClick: Callable[[QColor], None] = setFGColor,
+            ) -> None:
+        super().__init__()
+        self._app = app
+        self._onClick = onClick
+        self._tones: Tuple[float, ...] = ()
+        self._hovered = -1
+        self.setMouseTracking(True)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
+        app.registerCallback(['gamutMapping'], self.update)
+        self.destroyed.connect(
+            lambda: app.unregisterCallback(['gamutMapping'], self.update))
+
+    def setTones(self, tones: Tones) -> None:
+        self._tones = tones.astuple()
+        self.updateGeometry()
+        self.update()
+
+    def colors(self) -> List[QColor]:
+        return toneColors(self._tones, self._app.s.gamutMapping)
+
+    def sizeHint(self) -> QSize:
+        n = len(self._tones) // 3
+        return QSize(n * (patchHeight + 1) + 1, patchHeight + 2)
+
+    def minimumSizeHint(self) -> QSize:
+        return self.sizeHint()
+
+    def patchAt(self, pos: QPoint) -> int:
+        rects = patchRects(self.rect(), len(self._tones) // 3)
+        for i, rect in enumerate(rects):
+            if rect.contains(pos):
+                return i
+        return -1
+
+    def paintEvent(self, event) -> None:
+        painter = QPainter(self)
+        paintTones(painter, self.rect(), self.colors(), self._app.style['background'], self._hovered)
+        painter.end()
+
+    def _setHovered(self, i: int) -> None:
+        if i != self._hovered:
+            self._hovered = i
+            self.update()
+
+    def mouseMoveEvent(self, event) -> None:
+        self._setHovered(self.patchAt(event.pos()))
+
+    def leaveEvent(self, event) -> None:
+        self._setHovered(-1)
+
+    def mouseReleaseEvent(self, event) -> None:
+        i = self.patchAt(event.pos())
+        if event.button() == Qt.LeftButton and i >= 0:
+            self._onClick(self.colors()[i])
+
+    def event(self, event) -> bool:
+        if event.type() == QEvent.ToolTip:
+            i = self.patchAt(event.pos())
+            if i >= 0:
+                QToolTip.showText(event.globalPos(), str(list(self._tones[3*i:3*i+3])), self)
+            else:
+                QToolTip.hideText()
+                event.ignore()
+            return True
+        return super().event(event)
+
+class ColorButton(QPushButton):
+    """Push button filled with a color, with contrasting text."""
+    def __init__(self, text: str, hoverColor: QColor) -> None:
+        super().__init__(text)
+        self._color = QColor()
+        self._hoverColor = hoverColor
+
+    def setColor(self, color: QColor) -> None:
+        if color != self._color:
+            self._color = color
+            self.update()
+
+    def enterEvent(self, event) -> None:
+        self.update()
+
+    def leaveEvent(self, event) -> None:
+        self.update()
+
+    def paintEvent(self, event) -> None:
+        painter = QPainter(self)
+        rect = self.rect()
+        painter.fillRect(rect, self._color)
+        if self.underMouse():
+            painter.setPen(self._hoverColor)
+            painter.drawRect(rect.adjusted(0, 0, -1, -1))
+        painter.setPen(scaleColor(self._color, 1, 96 if self._color.value() < 128 else -96))
+        painter.drawText(rect, Qt.AlignCenter, self.text())
+        painter.end()
@@ -1,11 +1,12 @@
 import math
+import os
 import re
 import krita as K # type: ignore
+from dataclasses import replace
 from pathlib import Path
 from typing import Callable, Optional, List, Tuple
-from .matrix import (
-    Vec,
-)
+from xml.etree.ElementTree import ParseError
+from zipfile import BadZipFile
 from .state import (
     HalfToneSet,
     generateColors,
@@ -14,14 +15,19 @@ from .app import HalfToneSelectorApp
 from .ki import (
     getFGColor,
     getBGColor,
-    setFGColor,
     openFGColorDialog,
-    scaleColor,
     oklchToQColor,
     qcolorToOklch,
     qcolorToOklchFunc,
 )
-from .palette import exportPalette
+from .palette import (
+    exportPalette,
+    importPalettes,
+)
+from .toneStrip import (
+    ColorButton,
+    ToneStrip,
+)
 
 def addLayout(
         qlayout: Callable[[], K.QLayout],
@@ -69,39 +75,22 @@ def toneSelectOption(app: HalfToneSelectorApp, field: str, opt: dict) -> K.QPush
     button.clicked.connect(lambda: handleClick(opt['getColor']))
     return button
 
-def toneSelectColorStyle(app: HalfToneSelectorApp, field: str):
-    lch = getattr(app.s, field)
-    color = oklchToQColor(lch)
-    fontColor = scaleColor(color, 1, 96 if color.value() < 128 else -96)
-    return f'''
-        QPushButton {{
-            border: 0px solid transparent;
-            border-radius: 0px;
-            padding: 5px 10px;
-            background-color: {color.name()};
-            color: {fontColor.name()};
-        }}
-        QPushButton::hover {{
-            border: 1px solid {app.style['window'].name()};
-        }}
-    '''
-
 def handleColorDialog(app: HalfToneSelectorApp, field: str) -> None:
     def handler(color: K.QColor) -> None:
         if color and color.isValid():
             lch = qcolorToOklch(color)
             app.setState(**{field: lch})
     lch = getattr(app.s, field)
-    openFGColorDialog(oklchToQColor(lch), handler)
+    openFGColorDialog(oklchToQColor(lch, app.s.gamutMapping), handler)
 
 def toneSelectColor(app: HalfToneSelectorApp, field: str) -> K.QPushButton:
-    button = K.QPushButton('Color')
+    button = ColorButton('Color', app.style['window'])
     button.setSizePolicy(K.QSizePolicy.Expanding, K.QSizePolicy.Fixed)
     def updateColor():
-        button.setStyleSheet(toneSelectColorStyle(app, field))
+        button.setColor(oklchToQColor(getattr(app.s, field), app.s.gamutMapping))
     updateColor()
     button.clicked.connect(lambda: handleColorDialog(app, field))
-    app.registerCallback([field], updateColor)
+    app.registerCallback([field, 'gamutMapping'], updateColor)
     return button
 
 def toneSelectLabel(app: HalfToneSelectorApp, name: str) -> K.QLabel:
@@ -231,113 +220,6 @@ def toneSettings(app: HalfToneSelectorApp) -> K.QWidget:
     layout.setSpacing(5)
     return widget
 
-def updatePatchColor(app: HalfToneSelectorApp, patch: K.QWidget, lch: Vec) -> None:
-    color = oklchToQColor(lch)
-    patch.setStyleSheet(f'''
-        QPushButton {{
-            border: 0px solid transparent;
-            border-radius: 0px;
-            background-color: {color.name()};
-        }}
-        QPushButton::hover {{
-            border: 0.5px solid {app.style['background'].name()};
-        }}
-    ''')
-    patch.setToolTip(str(lch))
-    patch.clicked.connect(lambda: setFGColor(color))
-
-def colorBarPatch(app: HalfToneSelectorApp, lch: Vec) -> K.QPushButton:
-    patch = K.QPushButton()
-    patch.setMinimumSize(18, 18)
-    updatePatchColor(app, patch, lch)
-    return patch
-
-def colorBarPatches(app: HalfToneSelectorApp, hts: HalfToneSet) -> K.QWidget:
-    patches = [colorBarPatch(app, tone) for tone in hts.tones]
-    widget, layout = addLayout(qlayout=K.QHBoxLayout, childWidgets=patches)
-    widget.setStyleSheet(f'''
-        QWidget {{
-            border: 0px solid transparent;
-            border-radius: 0px;
-            background-color: {app.style['background'].name()};
-        }}
-    ''')
-    layout.setContentsMargins(1, 1, 1, 1)
-    layout.setSpacing(1)
-    return widget
-
-def setLineHeight(line: K.QLineEdit, pt: int) -> None:
-    font = line.font()
-    font.setPointSize(pt)
-    line.setFont(font)
-    fm = K.QFontMetrics(line.font())
-    line.setFixedHeight(fm.height())
-
-def colorBarName(app: HalfToneSelectorApp, hts: HalfToneSet) -> K.QLineEdit:
-    line = K.QLineEdit(hts.name)
-    line.setPlaceholderText('Name')
-    line.textChanged.connect(lambda text: setattr(hts, 'name', text))
-    setLineHeight(line, 8)
-    line.setStyleSheet(f'''
-        QLineEdit {{
-            font-size: 8pt;
-            padding: 0px;
-            margin: 0px;
-            border: 0px solid transparent;
-        }}
-        QLineEdit::Hover {{
-            background-color: {app.style['background'].name()};
-        }}
-    ''')
-    def handleVisible():
-        return line.setVisible(app.visible or bool(line.text()))
-    handleVisible()
-    app.registerCallback(['visible'], handleVisible)
-    line.destroyed.connect(
-        lambda: app.unregisterCallback(['visible'], handleVisible))
-    return line
-
-def colorBarMain(app: HalfToneSelectorApp, hts: HalfToneSet) -> K.QWidget:
-    widget, layout = addLayout(
-        qlayout=K.QVBoxLayout,
-        childWidgets=[
-            colorBarPatches(app, hts),
-            colorBarName(app, hts),
-        ])
-    widget.setStyleSheet(f'''
-        QWidget {{
-            background-color: {app.style['label'].name()};
-        }}
-    ''')
-    layout.setContentsMargins(5, 2, 5, 2)
-    layout.setSpacing(1)
-    return widget
-
-def colorBarDelete(app: HalfToneSelectorApp, hts: HalfToneSet) -> K.QWidget:
-    button = K.QPushButton()
-    button.setIcon(K.Krita.instance().icon('deletelayer'))
-    button.setSizePolicy(K.QSizePolicy.Fixed, K.QSizePolicy.Fixed)
-    button.clicked.connect(lambda: app.removeHalfToneSet(hts))
-    def handleVisible():
-        button.setVisible(app.visible)
-    handleVisible()
-    app.registerCallback(['visible'], handleVisible)
-    button.destroyed.connect(
-        lambda: app.unregisterCallback(['visible'], handleVisible))
-    return button
-
-def colorBarWidget(app: HalfToneSelectorApp, hts: HalfToneSet) -> K.QWidget:
-    widget, layout = addLayout(
-        qlayout=K.QHBoxLayout,
-        childWidgets=[
-            colorBarMain(app, hts),
-            colorBarDelete(app, hts),
-        ])
-    layout.setAlignment(K.Qt.AlignTop)
-    layout.setContentsMargins(0, 0, 0, 0)
-    layout.setSpacing(1)
-    return widget
-
 def samplingCountWidget(app: HalfToneSelectorApp) -> K.QWidget:
     spinBox, widget, _ = labeledInput('Count', K.QSpinBox)
     spinBox.setRange(1, 10)
@@ -365,6 +247,21 @@ def samplingChoiceWidget(app: HalfToneSelectorApp) -> K.QWidget:
     layout.setContentsMargins(0, 0, 0, 0)
     return widget
 
+def gamutMappingWidget(app: HalfToneSelectorApp) -> K.QWidget:
+    clip = toggleButton('Clip', app.s.gamutMapping == 'clip',
+        lambda: app.setState(gamutMapping='clip'))
+    chroma = toggleButton('Reduce chroma', app.s.gamutMapping == 'chroma',
+        lambda: app.setState(gamutMapping='chroma'))
+
+    def handleGamutMapping():
+        clip.setChecked(app.s.gamutMapping == 'clip')
+        chroma.setChecked(app.s.gamutMapping == 'chroma')
+
+    app.registerCallback(['gamutMapping'], handleGamutMapping)
+    widget, layout = addLayout(qlayout=K.QHBoxLayout, childWidgets=[clip, chroma])
+    layout.setContentsMargins(0, 0, 0, 0)
+    return widget
+
 def samplingSettings(app: HalfToneSelectorApp) -> K.QWidget:
     widget, layout = addLayout(
         qlayout=K.QVBoxLayout,
@@ -373,6 +270,8 @@ def samplingSettings(app: HalfToneSelectorApp) -> K.QWidget:
             samplingCountWidget(app),
             K.QLabel('Distribution:'),
             samplingChoiceWidget(app),
+            K.QLabel('Out of gamut:'),
+            gamutMappingWidget(app),
         ])
     layout.setContentsMargins(2, 2, 2, 2)
     layout.setSpacing(5)
@@ -391,33 +290,26 @@ def visCheckBox(app: HalfToneSelectorApp) -> K.QCheckBox:
     box.toggled.connect(lambda checked: handleToggle(box, checked))
     return box
 
-def updatePreviewPatches(app: HalfToneSelectorApp, patches: K.QWidget) -> None:
-    hts = generateColors(app.s)
-    patchesLayout = patches.layout().itemAt(0).widget().layout()
-    n = len(hts.tones)
-    m = patchesLayout.count()
-
-    for i in range(m):
-        patch = patchesLayout.itemAt(i).widget()
-        patch.setVisible(i < n)
-    for i, tone in zip(range(n), hts.tones):
-        if i < m:
-            patch = patchesLayout.itemAt(i).widget()
-            patch.clicked.disconnect()
-            updatePatchColor(app, patch, tone)
-        else:
-            patchesLayout.addWidget(colorBarPatch(app, tone))
-
 def previewPatches(app: HalfToneSelectorApp) -> K.QWidget:
-    hts = generateColors(app.s)
-    hts.name = 'Preview'
-    widget = colorBarMain(app, hts)
-    # Make name read only
-    widget.layout().itemAt(1).widget().setReadOnly(True)
+    strip = ToneStrip(app)
+    strip.setTones(generateColors(app.s).tones)
+    label = K.QLabel('Preview')
+    font = label.font()
+    font.setPointSize(8)
+    label.setFont(font)
+    widget, layout = addLayout(qlayout=K.QVBoxLayout, childWidgets=[strip, label])
+    widget.setStyleSheet(f'''
+        QWidget {{
+            background-color: {app.style['label'].name()};
+        }}
+    ''')
+    layout.setContentsMargins(5, 2, 5, 2)
+    layout.setSpacing(1)
 
+    # Dragging a selector only repaints the strip.
     app.registerCallback(
         fields=['light', 'dark', 'k', 'count', 'cos'],
-        cb=lambda: updatePreviewPatches(app, widget))
+        cb=lambda: strip.setTones(generateColors(app.s).tones))
     return widget
 
 def previewSettings(app: HalfToneSelectorApp) -> K.QWidget:
@@ -432,9 +324,10 @@ def previewSettings(app: HalfToneSelectorApp) -> K.QWidget:
     return widget
 
 class ExportPaletteDialog(K.QWidget):
-    def __init__(self, halfTones: List[HalfToneSet]) -> None:
+    def __init__(self, halfTones: List[HalfToneSet], gamutMapping: str = 'clip') -> None:
         super().__init__()
         self._halfTones = halfTones
+        self._gamutMapping = gamutMapping
         self._isValidName = False
         self._isPathSet = False
         self._nameText = K.QLineEdit()
@@ -493,7 +386,7 @@ class ExportPaletteDialog(K.QWidget):
     def _handleExportButton(self) -> None:
         name = self._nameText.text()
         path = Path(self._pathText.text())
-        exportPalette(self._halfTones, name, path)
+        exportPalette(self._halfTones, name, path, gamutMapping=self._gamutMapping)
         self.close()
 
     def _handleCancelButton(self) -> None:
@@ -507,6 +400,41 @@ class ExportPaletteDialog(K.QWidget):
         self._exportButton.clicked.connect(self._handleExportButton)
         self._cancelButton.clicked.connect(self._handleCancelButton)
 
+def extractButton(app: HalfToneSelectorApp) -> Optional[K.QPushButton]:
+    """Button proposing light and dark from the active layer or an image
+    file. None without NumPy, which extraction needs."""
+    try:
+        from . import extract
+    except ModuleNotFoundError:
+        return None
+
+    def apply(tiles) -> None:
+        try:
+            light, dark = extract.extractTones(tiles)
+        except ValueError as e:
+            K.QMessageBox.warning(button, 'Tones from image', str(e))
+            return
+        app.setState(light=light, dark=dark)
+
+    def fromLayer() -> None:
+        doc = K.Krita.instance().activeDocument()
+        node = doc.activeNode() if doc else None
+        if node:
+            apply(extract.layerTiles(node))
+
+    def fromFile() -> None:
+        path, _ = K.QFileDialog.getOpenFileName(
+            button, 'Tones from image', '', 'Images (*.png *.jpg *.jpeg *.tif *.tiff *.webp *.bmp)')
+        if path:
+            apply(extract.imageTiles(Path(path)))
+
+    button = K.QPushButton('Tones from image')
+    menu = K.QMenu(button)
+    menu.addAction('Active layer', fromLayer)
+    menu.addAction('Image file...', fromFile)
+    button.setMenu(menu)
+    return button
+
 def settingsWidget(app: HalfToneSelectorApp) -> K.QWidget:
     def create():
         hts = generateColors(app.s)
@@ -516,20 +444,38 @@ def settingsWidget(app: HalfToneSelectorApp) -> K.QWidget:
     createButton.clicked.connect(create)
 
     def export():
-        exportButton._dialog = ExportPaletteDialog(app.s.halfTones)
+        exportButton._dialog = ExportPaletteDialog(app.s.halfTones, app.s.gamutMapping)
         exportButton._dialog.show()
 
     exportButton = K.QPushButton('Export to palette')
     exportButton.clicked.connect(export)
 
+    def importKpl():
+        files, _ = K.QFileDialog.getOpenFileNames(
+            importButton, 'Import palettes', '', 'Krita palettes (*.kpl)')
+        paths = [Path(f) for f in files]
+        # Read every palette first, so a bad file adds nothing.
+        try:
+            sets = list(importPalettes(paths, workers=min(len(paths), os.cpu_count() or 1)))
+        except (BadZipFile, ParseError, KeyError, ValueError, OSError) as e:
+            K.QMessageBox.warning(importButton, 'Import palettes', str(e))
+            return
+        app.addHalfToneSets(sets)
+
+    importButton = K.QPushButton('Import palettes')
+    importButton.clicked.connect(importKpl)
+
+    extract = extractButton(app)
     widget, layout = addLayout(
         qlayout=K.QVBoxLayout,
         childWidgets=[
             toneSettings(app),
+            *([extract] if extract else []),
             samplingSettings(app),
             previewSettings(app),
             createButton,
             exportButton,
+            importButton,
         ])
     layout.setContentsMargins(0, 0, 0, 0)
     layout.setSpacing(5)
@@ -544,47 +490,34 @@ def addScrollArea(widget: K.QWidget) -> K.QScrollArea:
     scrollArea.setWidget(widget)
     return scrollArea
 
-def palette(app: HalfToneSelectorApp) -> K.QWidget:
-    colorBars = [colorBarWidget(app, hts) for hts in app.s.halfTones]
-    widget, layout = addLayout(qlayout=K.QVBoxLayout, childWidgets=colorBars)
-    layout.setContentsMargins(0, 0, 0, 0)
-    layout.setSpacing(5)
-
-    def handleAdd(i: int):
-        hts = app.s.halfTones[i]
-        layout.addWidget(colorBarWidget(app, hts))
-
-    def handleRemove(i: int):
-        item = layout.itemAt(i)
-        layout.removeItem(item)
-        item.widget().deleteLater()
-
-    app.registerCallback(['addHalfToneSet'], handleAdd)
-    app.registerCallback(['removeHalfToneSet'], handleRemove)
-    return widget
-
 from .toneSettings import toneSettings as ts
+from .paletteView import paletteView
 
 class HalfToneSelectorWidget(K.QSplitter):
     def __init__(self, app: HalfToneSelectorApp) -> None:
         super().__init__()
         self._app = app
+        settings = addScrollArea(settingsWidget(app))
+        settings.setVisible(app.visible)
+        app.registerCallback(['visible'], lambda: settings.setVisible(app.visible))
+        # The palette scrolls on its own so only the rows in view are drawn.
         widget, layout = addLayout(
             qlayout=K.QVBoxLayout,
             childWidgets=[
                 visCheckBox(app),
-                settingsWidget(app),
-                palette(app),
+                settings,
+                paletteView(app),
             ])
+        layout.setStretch(1, 3)
+        layout.setStretch(2, 2)
         layout.setSpacing(5)
-        layout.setAlignment(K.Qt.AlignTop)
         widget.setStyleSheet(f'''
             QWidget {{
                 background-color: {app.style['background'].name()};
             }}
         ''')
         tsVisuals = ts(app)
-        self.addWidget(addScrollArea(widget))
+        self.addWidget(widget)
         self.addWidget(tsVisuals)
 
         self.setSizes(self._app.s.visibleMeta.splitterSizes)
@@ -595,4 +528,5 @@ class HalfToneSelectorWidget(K.QSplitter):
 
     def _updateSplitterSizes(self) -> None:
         if self._app.visible:
-            self._app.s.visibleMeta.splitterSizes = self.sizes()
+            self._app.setState(visibleMeta=replace(
+                self._app.s.visibleMeta, splitterSizes=self.sizes()))
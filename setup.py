@@ -3,4 +3,7 @@ from setuptools import setup, find_packages # type: ignore
 setup(
     name = 'half_tone_selector',
     packages = find_packages(),
+    entry_points = {
+        'console_scripts': ['half_tone_selector=half_tone_selector.cli:main'],
+    },
 )
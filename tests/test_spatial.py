@@ -0,0 +1,66 @@
+import random
+from math import dist
+from half_tone_selector.color import convertColorSpace
+from half_tone_selector.spatial import ToneIndex
+from half_tone_selector.state import HalfToneSet
+
+def randomSets(rng: random.Random, n: int, maxChroma: float):
+    return [
+        HalfToneSet(name='', tones=[
+            [rng.random(), rng.random() * maxChroma, rng.random() * 6.28]
+            for _ in range(rng.randint(1, 7))])
+        for _ in range(n)]
+
+def bruteForce(sets, lab, k):
+    tones = [
+        convertColorSpace(lch, 'Oklch', 'Oklab')
+        for hts in sets for lch in hts.tones]
+    return sorted(dist(lab, other) for other in tones)[:k]
+
+def checkQueries(rng, index, sets):
+    assert len(index) == sum(len(hts.tones) for hts in sets)
+    for _ in range(100):
+        lab = [rng.uniform(-0.2, 1.2), rng.uniform(-0.5, 0.5), rng.uniform(-0.5, 0.5)]
+        for k in (1, 5):
+            found = index.nearest(lab, k)
+            assert [d for d, _, _ in found] == bruteForce(sets, lab, k)
+            for d, hts, j in found:
+                assert dist(lab, convertColorSpace(hts.tones[j], 'Oklch', 'Oklab')) == d
+
+def test_nearest_matches_brute_force():
+    rng = random.Random(0)
+    # A neutral cluster, a spread of colors and repeated black tones.
+    sets = randomSets(rng, 150, 0.01) + randomSets(rng, 150, 0.3)
+    sets += [HalfToneSet(name='', tones=[[0, 0, 0]]) for _ in range(30)]
+    rng.shuffle(sets)
+    index = ToneIndex()
+    for i, hts in enumerate(sets[:200]):
+        index.insert(i, hts)
+    # Fewer than are indexed, so inserted one by one.
+    index.insertMany(200, sets[200:])
+    checkQueries(rng, index, sets)
+    # More than are indexed, so the tree is rebuilt.
+    more = randomSets(rng, 400, 0.2)
+    index.insertMany(0, more)
+    sets[:0] = more
+    checkQueries(rng, index, sets)
+    for _ in range(200):
+        i = rng.randrange(len(sets))
+        index.remove(i)
+        sets.pop(i)
+    checkQueries(rng, index, sets)
+
+def test_sorted_inserts_stay_shallow():
+    sets = [HalfToneSet(name='', tones=[[i / 2000, 0.1, 1.0]]) for i in range(2000)]
+    index = ToneIndex()
+    for i, hts in enumerate(sets):
+        index.insert(i, hts)
+    def depth(node):
+        if node.entries is not None:
+            return 1
+        return 1 + max(depth(node.left), depth(node.right))
+    assert depth(index._root) <= 20
+    checkQueries(random.Random(1), index, sets)
+
+def test_empty():
+    assert ToneIndex().nearest([0.5, 0, 0]) == []